@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def query_budgets(settings):
+    # как и QueryBudgetRunner: страница сверх QUERY_BUDGETS или с N+1
+    # бросает QueryBudgetExceeded, и тест, открывший её, падает
+    settings.QUERY_BUDGET_MODE = 'raise'
+
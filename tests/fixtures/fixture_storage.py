@@ -0,0 +1,13 @@
+import pytest
+
+from core.test_runner import isolated_storage
+
+
+@pytest.fixture(scope='session', autouse=True)
+def storage(tmp_path_factory):
+    # как и QueryBudgetRunner: кэш и загрузки во временном каталоге,
+    # а не в рабочих файлах рядом с кодом
+    override = isolated_storage(str(tmp_path_factory.mktemp('storage')))
+    override.enable()
+    yield
+    override.disable()
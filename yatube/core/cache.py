@@ -0,0 +1,463 @@
+import copy
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+# в SQLite не больше 999 параметров в запросе
+CHUNK = 500
+# как часто процесс проверяет размер кэша, в записях
+CULL_EVERY = 50
+
+
+def isolated_caches(directory):
+    """Копия settings.CACHES с файлами кэшей, перенесёнными в directory.
+
+    Переносятся только алиасы, у которых LOCATION — абсолютный путь;
+    остальные (сервер memcached, имя LocMemCache) остаются как были.
+    """
+    isolated = copy.deepcopy(settings.CACHES)
+    for alias in isolated.values():
+        location = alias.get('LOCATION')
+        if location and os.path.isabs(location):
+            alias['LOCATION'] = os.path.join(
+                directory, os.path.basename(location))
+    return isolated
+
+
+def _chunks(items):
+    for start in range(0, len(items), CHUNK):
+        yield items[start:start + CHUNK]
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в локальном файле SQLite, общий для всех процессов хоста.
+
+    В отличие от LocMemCache, воркеры gunicorn видят одни и те же
+    записи и сбросы поколений, а в отличие от FileBasedCache
+    incr атомарен, get_many/set_many — один запрос, а вытеснение
+    идёт по давности обращения (LRU), а не случайно.
+
+    Файл работает в режиме WAL: чтения не ждут записей. Время
+    обращения обновляется не чаще раза в ACCESS_RESOLUTION секунд,
+    чтобы чтение не превращалось в запись.
+    """
+
+    ACCESS_RESOLUTION = 60
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        # соединение SQLite нельзя переносить через fork и между потоками
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.location, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection, self._local.pid = connection, pid
+        return self._local.connection
+
+    def _write(self):
+        return _Transaction(self._connection())
+
+    def get_backend_timeout(self, timeout=DEFAULT_TIMEOUT):
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        elif timeout == 0:
+            timeout = -1
+        return None if timeout is None else time.time() + timeout
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _fetch(self, keys):
+        """Живые записи по готовым ключам: {ключ: значение}."""
+        now = time.time()
+        found, stale = {}, []
+        connection = self._connection()
+        for chunk in _chunks(keys):
+            rows = connection.execute(
+                'SELECT key, value, accessed FROM cache '
+                f'WHERE key IN ({",".join("?" * len(chunk))}) '
+                'AND (expires IS NULL OR expires > ?)',
+                (*chunk, now),
+            )
+            for key, value, accessed in rows:
+                found[key] = pickle.loads(value)
+                if accessed < now - self.ACCESS_RESOLUTION:
+                    stale.append(key)
+        if stale:
+            with self._write() as cursor:
+                cursor.executemany(
+                    'UPDATE cache SET accessed = ? WHERE key = ?',
+                    [(now, key) for key in stale],
+                )
+        return found
+
+    def _store(self, cursor, items, timeout, mode='REPLACE'):
+        expires, now = self.get_backend_timeout(timeout), time.time()
+        cursor.executemany(
+            f'INSERT OR {mode} INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?)',
+            [
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 expires, now)
+                for key, value in items
+            ],
+        )
+        return cursor.rowcount
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._fetch([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        made = {self._key(key, version): key for key in keys}
+        return {
+            made[key]: value
+            for key, value in self._fetch(list(made)).items()
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as cursor:
+            self._store(cursor, [(key, value)], timeout)
+            self._cull(cursor)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        items = [
+            (self._key(key, version), value) for key, value in data.items()
+        ]
+        with self._write() as cursor:
+            self._store(cursor, items, timeout)
+            self._cull(cursor)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as cursor:
+            cursor.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, time.time()),
+            )
+            added = self._store(cursor, [(key, value)], timeout, 'IGNORE')
+            if added:
+                self._cull(cursor)
+        return bool(added)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as cursor:
+            cursor.execute(
+                'UPDATE cache SET expires = ? WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), key, time.time()),
+            )
+            return bool(cursor.rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        # BEGIN IMMEDIATE берёт блокировку записи до чтения: между
+        # SELECT и UPDATE значение не изменит другой процесс
+        with self._write() as cursor:
+            row = cursor.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            cursor.execute(
+                'UPDATE cache SET value = ?, accessed = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 time.time(), key),
+            )
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return key in self._fetch([key])
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        with self._write() as cursor:
+            cursor.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._write() as cursor:
+            for chunk in _chunks(keys):
+                cursor.execute(
+                    'DELETE FROM cache '
+                    f'WHERE key IN ({",".join("?" * len(chunk))})',
+                    chunk,
+                )
+
+    def clear(self):
+        with self._write() as cursor:
+            cursor.execute('DELETE FROM cache')
+
+    def _cull(self, cursor):
+        """Сначала удаляет истёкшие записи, затем давно не читанные.
+
+        Подсчёт строк стоит прохода по индексу, поэтому делается
+        раз в CULL_EVERY записей этого процесса; за это время кэш
+        может ненадолго превысить MAX_ENTRIES.
+        """
+        self._writes += 1
+        if self._writes % CULL_EVERY:
+            return
+        cursor.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = cursor.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries and not self._cull_frequency:
+            # как у встроенных бэкендов: CULL_FREQUENCY = 0 — очистить всё
+            cursor.execute('DELETE FROM cache')
+        elif count > self._max_entries:
+            cursor.execute(
+                'DELETE FROM cache WHERE key IN ('
+                ' SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                (count - self._max_entries
+                 + self._max_entries // self._cull_frequency,),
+            )
+
+    def close(self, **kwargs):
+        # соединение держим между запросами: открывать файл заново дорого
+        pass
+
+
+class _Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection.cursor()
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+class InvalidationJournal:
+    """Общий для процессов журнал сброшенных ключей.
+
+    Писатель дописывает ключи строками через O_APPEND, читатель по
+    os.stat видит, что файл вырос, и дочитывает новые строки. Когда
+    журнал разрастается, его заменяют пустым файлом; сменившийся
+    inode читатель понимает как «сбросить всё».
+    """
+
+    MAX_SIZE = 1024 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self._inode = None
+        self._offset = 0
+
+    def publish(self, keys):
+        data = ''.join(f'{key}\n' for key in keys).encode()
+        descriptor = os.open(
+            self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(descriptor, data)
+            size = os.fstat(descriptor).st_size
+        finally:
+            os.close(descriptor)
+        if size > self.MAX_SIZE:
+            self.rotate()
+
+    def rotate(self):
+        empty = f'{self.path}.{os.getpid()}'
+        open(empty, 'wb').close()
+        os.replace(empty, self.path)
+
+    def poll(self):
+        """Ключи, сброшенные с прошлого вызова; None — сбросить всё."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.publish([])
+            stat = os.stat(self.path)
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            first = self._inode is None
+            self._inode, self._offset = stat.st_ino, stat.st_size
+            return [] if first else None
+        if stat.st_size == self._offset:
+            return []
+        with open(self.path, 'rb') as journal:
+            journal.seek(self._offset)
+            data = journal.read(stat.st_size - self._offset)
+        # недописанную последнюю строку дочитаем в следующий раз
+        complete = data.rfind(b'\n') + 1
+        self._offset += complete
+        return data[:complete].decode().split()
+
+
+# как и у LocMemCache, L1 общий для всех потоков процесса
+_local_caches = {}
+_local_locks = {}
+_journals = {}
+_MISSING = object()
+
+
+class TwoLevelCache(BaseCache):
+    """L1 в памяти процесса перед общим кэшем L2.
+
+    В L1 попадают только ключи с префиксами LOCAL_PREFIXES — горячие
+    и небольшие: поколения таблиц, фрагменты лент, карточки. Любая
+    запись такого ключа идёт в L2 и в журнал LOCATION; перед чтением
+    каждый процесс сверяется с журналом и выбрасывает сброшенные
+    ключи, так что правка в одном воркере видна во всех. Записи L1
+    живут не дольше LOCAL_TIMEOUT — на случай потерянной строки
+    журнала при его ротации.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options['SHARED']
+        self._prefixes = tuple(options.get('LOCAL_PREFIXES', ()))
+        self._local_max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self._local = _local_caches.setdefault(location, OrderedDict())
+        self._lock = _local_locks.setdefault(location, threading.Lock())
+        self._journal = _journals.setdefault(
+            location, InvalidationJournal(location))
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _is_local(self, key):
+        return key.startswith(self._prefixes)
+
+    def _sync(self):
+        with self._lock:
+            dropped = self._journal.poll()
+            if dropped is None:
+                self._local.clear()
+            for key in dropped or ():
+                self._local.pop(key, None)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._local[key] = (value, time.monotonic() + self._local_timeout)
+            self._local.move_to_end(key)
+            while len(self._local) > self._local_max_entries:
+                self._local.popitem(last=False)
+
+    def _recall(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[1] < time.monotonic():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+            return entry[0]
+
+    def _invalidate(self, keys, version):
+        made = [
+            self.make_key(key, version=version)
+            for key in keys if self._is_local(key)
+        ]
+        if made:
+            with self._lock:
+                for key in made:
+                    self._local.pop(key, None)
+            self._journal.publish(made)
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        found, missing = {}, []
+        local = [key for key in keys if self._is_local(key)]
+        if local:
+            self._sync()
+        for key in keys:
+            value = (
+                self._recall(self.make_key(key, version=version))
+                if self._is_local(key) else _MISSING
+            )
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            fetched = self.shared.get_many(missing, version=version)
+            for key, value in fetched.items():
+                if self._is_local(key):
+                    self._remember(self.make_key(key, version=version), value)
+            found.update(fetched)
+        return found
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._invalidate([key], version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        self._invalidate(data, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._invalidate([key], version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self._invalidate([key], version)
+        return value
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version=version)
+        self._invalidate([key], version)
+
+    def delete_many(self, keys, version=None):
+        self.shared.delete_many(keys, version=version)
+        self._invalidate(keys, version)
+
+    def clear(self):
+        self.shared.clear()
+        with self._lock:
+            self._local.clear()
+            self._journal.rotate()
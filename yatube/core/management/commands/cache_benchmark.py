@@ -0,0 +1,102 @@
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'filebased': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'core.cache.SQLiteCache',
+    'twolevel': 'core.cache.TwoLevelCache',
+}
+LOCATIONS = {
+    'locmem': 'benchmark',
+    'filebased': '{}/filebased',
+    'sqlite': '{}/cache.sqlite3',
+    'twolevel': '{}/cache.journal',
+}
+# L1 поверх общего кэша проекта; ключи бенчмарка удаляются после прогона
+TWO_LEVEL_OPTIONS = {
+    'SHARED': 'shared',
+    'LOCAL_PREFIXES': ['benchmark:'],
+    'LOCAL_MAX_ENTRIES': 10 ** 6,
+}
+
+
+def _write_from_child(cache):
+    cache.set('benchmark:shared', 'из другого процесса')
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость бэкендов кэша на типичных операциях лент'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ops', type=int, default=2000)
+        parser.add_argument('--batch', type=int, default=20)
+        parser.add_argument(
+            'backends', nargs='*', default=list(BACKENDS),
+            help=f'из: {", ".join(BACKENDS)}')
+
+    def handle(self, *args, **options):
+        unknown = set(options['backends']) - set(BACKENDS)
+        if unknown:
+            raise CommandError(f'Неизвестные бэкенды: {", ".join(unknown)}')
+        directory = tempfile.mkdtemp()
+        try:
+            for name in options['backends']:
+                cache = import_string(BACKENDS[name])(
+                    LOCATIONS[name].format(directory),
+                    {'TIMEOUT': 300, 'OPTIONS': TWO_LEVEL_OPTIONS
+                     if name == 'twolevel' else {'MAX_ENTRIES': 10 ** 6}},
+                )
+                keys = self._report(
+                    name, cache, options['ops'], options['batch'])
+                cache.delete_many(keys)
+        finally:
+            shutil.rmtree(directory)
+
+    def _report(self, name, cache, ops, batch):
+        keys = [f'benchmark:{number}' for number in range(ops)]
+        value = {'html': 'x' * 2000, 'version': '1.2.3'}
+        chunks = [keys[i:i + batch] for i in range(0, ops, batch)]
+        cache.set('benchmark:counter', 0)
+        timings = {
+            'set': self._measure(ops, lambda: [
+                cache.set(key, value) for key in keys]),
+            'get': self._measure(ops, lambda: [
+                cache.get(key) for key in keys]),
+            'get_hot': self._measure(ops, lambda: [
+                cache.get(keys[number % batch]) for number in range(ops)]),
+            'set_many': self._measure(ops, lambda: [
+                cache.set_many({key: value for key in chunk})
+                for chunk in chunks]),
+            'get_many': self._measure(ops, lambda: [
+                cache.get_many(chunk) for chunk in chunks]),
+            'incr': self._measure(ops, lambda: [
+                cache.incr('benchmark:counter') for key in keys]),
+        }
+        self.stdout.write(name + ': ' + ', '.join(
+            f'{operation} {rate:,.0f} ключей/с'
+            for operation, rate in timings.items()
+        ))
+        self.stdout.write(
+            f'  общий между процессами: {self._is_shared(cache)}')
+        return keys + ['benchmark:counter', 'benchmark:shared']
+
+    @staticmethod
+    def _measure(ops, run):
+        started = time.perf_counter()
+        run()
+        return ops / (time.perf_counter() - started)
+
+    @staticmethod
+    def _is_shared(cache):
+        cache.delete('benchmark:shared')
+        process = multiprocessing.get_context('fork').Process(
+            target=_write_from_child, args=(cache,))
+        process.start()
+        process.join()
+        return 'да' if cache.get('benchmark:shared') else 'нет'
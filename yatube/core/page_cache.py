@@ -0,0 +1,115 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'page:version:{}'
+PAGE_KEY = 'page:{}:{}:{}'
+
+
+def _digest(value):
+    return hashlib.md5(value.encode()).hexdigest()
+
+
+def _version(path):
+    key = VERSION_KEY.format(_digest(path))
+    version = cache.get(key)
+    if version is None:
+        version = int(time.time() * 1000)
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def page_key(path, query_string):
+    """Ключ страницы: путь, его версия и строка запроса.
+
+    Версия общая для всех query-вариантов пути, поэтому purge()
+    одним incr отсекает и ?cursor=..., и ?page=... этой страницы.
+    """
+    return PAGE_KEY.format(
+        _digest(path), _version(path), _digest(query_string))
+
+
+def depends_on(request, *tags):
+    """Страница зависит не только от своего пути, но и от tags.
+
+    Тег — любая строка, например 'author:5'; purge('author:5')
+    сбрасывает все закэшированные страницы, отметившие этот тег,
+    не перечисляя их пути. Версии запоминаются в момент вызова,
+    поэтому вызывать стоит до чтения зависимых данных.
+    """
+    if getattr(request, '_page_cache_key', None) is None:
+        return
+    request._page_cache_tags = {tag: _version(tag) for tag in tags}
+
+
+def purge(*paths):
+    """Сбрасывает страницы путей (или тегов depends_on) сейчас и ещё
+    раз после коммита.
+
+    Аноним, пришедший до коммита, закэшировал бы старую страницу
+    под новой версией; повтор в on_commit её отсекает.
+    """
+    paths = set(paths)
+    _purge(paths)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _purge(paths))
+
+
+def _purge(paths):
+    for path in paths:
+        key = VERSION_KEY.format(_digest(path))
+        try:
+            cache.incr(key)
+        except ValueError:
+            pass
+
+
+class AnonymousPageCacheMiddleware:
+    """Кэш целых страниц для анонимных читателей.
+
+    Кэшируются только view из PAGE_CACHE_VIEWS; устаревание —
+    точечным purge() из сигналов, а не коротким таймаутом.
+    Выключается PAGE_CACHE_TIMEOUT = 0.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        key = getattr(request, '_page_cache_key', None)
+        if key is not None and self._cacheable(response):
+            tags = getattr(request, '_page_cache_tags', {})
+            cache.set(key, (response, tags), settings.PAGE_CACHE_TIMEOUT)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.PAGE_CACHE_TIMEOUT:
+            return None
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        if request.resolver_match.view_name not in settings.PAGE_CACHE_VIEWS:
+            return None
+        if request.user.is_authenticated:
+            return None
+        key = page_key(request.path, request.META.get('QUERY_STRING', ''))
+        entry = cache.get(key)
+        if entry is not None:
+            response, tags = entry
+            if all(_version(tag) == version
+                   for tag, version in tags.items()):
+                return response
+        request._page_cache_key = key
+        return None
+
+    @staticmethod
+    def _cacheable(response):
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+        )
@@ -0,0 +1,199 @@
+import logging
+import os
+import re
+import sys
+import threading
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Node
+
+logger = logging.getLogger(__name__)
+
+_NUMBER = re.compile(r'\b\d+\b')
+_PARAMS = re.compile(r'\((?:%s, )+%s\)')
+_RENDER_NODE = Node.render_annotated.__code__
+_SKIPPED = (os.path.abspath(__file__), os.sep + 'site-packages' + os.sep)
+SHOWN_LOCATIONS = 3
+
+_state = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Страница превысила бюджет запросов или делает N+1."""
+
+
+def shape(sql):
+    """Форма запроса: числа и списки IN (...) любой длины совпадают."""
+    return _PARAMS.sub('(%s, …)', _NUMBER.sub('?', sql))
+
+
+def location():
+    """Откуда выполнен запрос: строка шаблона, иначе строка кода проекта.
+
+    Узел шаблона, внутри которого идёт запрос, виден по кадру
+    Node.render_annotated; самый внутренний и есть виновник.
+    """
+    frame, code_line = sys._getframe(1), None
+    while frame is not None:
+        code = frame.f_code
+        if code is _RENDER_NODE:
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            if token is not None:
+                origin = node.origin
+                return (f'{origin.template_name or origin.name}'
+                        f':{token.lineno}')
+        elif code_line is None and code.co_filename.startswith(
+                str(settings.BASE_DIR)) and not any(
+                skipped in code.co_filename for skipped in _SKIPPED):
+            code_line = (
+                f'{os.path.relpath(code.co_filename, settings.BASE_DIR)}'
+                f':{frame.f_lineno}')
+        frame = frame.f_back
+    return code_line
+
+
+class QueryReport:
+    """Запросы, выполненные за время recording(): форма и место."""
+
+    def __init__(self):
+        self.count = 0
+        self.shapes = Counter()
+        self.locations = defaultdict(Counter)
+        # формы запросов из блоков cache_fill()
+        self.filled = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        query_shape = shape(sql)
+        self.shapes[query_shape] += 1
+        self.locations[query_shape][location()] += 1
+        if getattr(_state, 'filling', 0):
+            self.filled[query_shape] += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold, shapes=None):
+        """(форма, сколько раз, места) для форм, повторённых threshold раз."""
+        if shapes is None:
+            shapes = self.shapes
+        return [
+            (query_shape, count, [
+                place for place, _ in self.locations[query_shape]
+                .most_common(SHOWN_LOCATIONS)])
+            for query_shape, count in shapes.most_common()
+            if count >= threshold
+        ]
+
+    def problems(self, budget=None, repeat=None, filled=True):
+        """Описания нарушений; пустой список — всё в порядке.
+
+        filled=False не считает запросы из cache_fill().
+        """
+        if repeat is None:
+            repeat = settings.QUERY_BUDGET_REPEAT
+        count, shapes = self.count, self.shapes
+        if not filled:
+            count -= sum(self.filled.values())
+            shapes = shapes - self.filled
+        found = []
+        if budget is not None and count > budget:
+            found.append(f'{count} запросов при бюджете {budget}')
+        for query_shape, times, places in self.repeated(repeat, shapes):
+            found.append(
+                f'N+1: {times} раз {query_shape}\n    из '
+                + ', '.join(str(place) for place in places))
+        return found
+
+
+@contextmanager
+def cache_fill():
+    """Запросы блока считаются и пишутся в лог, но не роняют страницу.
+
+    Для работы, которая делается один раз и дальше берётся из кэша,
+    например миниатюры, не созданные заранее. Такие запросы видны:
+    в режиме 'log' — в том же предупреждении.
+    """
+    _state.filling = getattr(_state, 'filling', 0) + 1
+    try:
+        yield
+    finally:
+        _state.filling -= 1
+
+
+@contextmanager
+def recording(report=None):
+    """Считает запросы ко всем базам внутри блока в report."""
+    if report is None:
+        report = QueryReport()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(report))
+        yield report
+
+
+@contextmanager
+def assert_budget(budget=None, repeat=None):
+    """Падает, если блок сделал больше budget запросов или N+1."""
+    with recording() as report:
+        yield report
+    found = report.problems(budget, repeat)
+    if found:
+        raise QueryBudgetExceeded('\n'.join(found))
+
+
+def budget_for(request):
+    """Бюджет из QUERY_BUDGETS по имени view; проверяются только чтения."""
+    match = request.resolver_match
+    if match is None or request.method not in ('GET', 'HEAD'):
+        return None
+    return settings.QUERY_BUDGETS.get(match.view_name)
+
+
+class QueryBudgetMiddleware:
+    """Считает запросы каждого запроса и ищет N+1.
+
+    QUERY_BUDGET_MODE: 'off' — ничего не делает, 'log' — пишет
+    нарушения в лог с местами в шаблонах, 'raise' — ещё и бросает
+    QueryBudgetExceeded, от чего падает тест, открывший страницу;
+    нарушения только из-за cache_fill() при этом лишь пишутся в лог.
+    Потоковые ответы проверяются, когда прочитаны до конца: их
+    запросы выполняются уже после возврата из view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.QUERY_BUDGET_MODE == 'off':
+            return self.get_response(request)
+        with recording() as report:
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self._streamed(
+                request, response.streaming_content, report)
+        else:
+            self._check(request, report)
+        return response
+
+    def _streamed(self, request, content, report):
+        with recording(report):
+            yield from content
+        self._check(request, report)
+
+    @staticmethod
+    def _check(request, report):
+        budget = budget_for(request)
+        found = report.problems(budget)
+        if not found:
+            return
+        message = f'{request.method} {request.path}: ' + '; '.join(found)
+        filled = sum(report.filled.values())
+        if filled:
+            message += f' (при заполнении кэша: {filled})'
+        logger.warning(message)
+        if (settings.QUERY_BUDGET_MODE == 'raise'
+                and report.problems(budget, filled=False)):
+            raise QueryBudgetExceeded(message)
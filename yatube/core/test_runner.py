@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+from .cache import isolated_caches
+
+
+def isolated_storage(directory):
+    """override_settings, уводящий файлы кэша и загрузки в directory.
+
+    Тесты чистят кэш и пишут картинки; рабочий кэш и media/ рядом
+    с кодом они трогать не должны. Заранее миниатюры не считаются:
+    воркеры пула стартуют с настройками из settings.py и писали бы
+    в рабочие базу, кэш и media/; кому нужно — включает 'sync'.
+    """
+    return override_settings(
+        CACHES=isolated_caches(directory),
+        MEDIA_ROOT=os.path.join(directory, 'media'),
+        THUMBNAIL_PREGENERATE='',
+    )
+
+
+class QueryBudgetRunner(DiscoverRunner):
+    """Раннер, при котором превышение бюджета запросов роняет тест.
+
+    Бюджеты и поиск N+1 — core.query_budget.QueryBudgetMiddleware.
+    Кэш и загрузки живут во временном каталоге на время прогона.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._directory = tempfile.mkdtemp(prefix='yatube-tests-')
+        self._overrides = [
+            override_settings(QUERY_BUDGET_MODE='raise'),
+            isolated_storage(self._directory),
+        ]
+        for override in self._overrides:
+            override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        for override in reversed(self._overrides):
+            override.disable()
+        shutil.rmtree(self._directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
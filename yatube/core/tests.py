@@ -0,0 +1,186 @@
+import multiprocessing
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+
+from .cache import SQLiteCache, TwoLevelCache
+from .query_budget import (
+    QueryBudgetExceeded, assert_budget, cache_fill, recording, shape)
+
+
+def _increment(location):
+    cache = SQLiteCache(location, {})
+    for _ in range(50):
+        cache.incr('counter')
+
+
+def _set_value(journal, value):
+    TwoLevelCache(journal, {'OPTIONS': {
+        'SHARED': 'shared', 'LOCAL_PREFIXES': ['hot:']}}).set('hot:key', value)
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = f'{self.directory}/cache.sqlite3'
+        self.cache = SQLiteCache(
+            self.location, {'OPTIONS': {'MAX_ENTRIES': 60}})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_set_many(self):
+        self.cache.set_many({'a': 1, 'b': [2]})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': [2]})
+        self.cache.delete_many(['a'])
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_timeout(self):
+        self.cache.set('expired', 1, -1)
+        self.assertIsNone(self.cache.get('expired'))
+        self.assertTrue(self.cache.add('expired', 2))
+        self.assertFalse(self.cache.add('expired', 3))
+        self.assertEqual(self.cache.get('expired'), 2)
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=_increment, args=(self.location,))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_least_recently_used_are_evicted(self):
+        self.cache.ACCESS_RESOLUTION = 0
+        self.cache.set('hot', 1)
+        for number in range(100):
+            self.cache.set(f'cold{number}', number)
+            self.cache.get('hot')
+        self.assertEqual(self.cache.get('hot'), 1)
+        self.assertIsNone(self.cache.get('cold0'))
+
+    def test_zero_cull_frequency_clears_cache(self):
+        cache = SQLiteCache(self.location, {'OPTIONS': {
+            'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 0}})
+        for number in range(50):
+            cache.set(f'key{number}', number)
+        self.assertIsNone(cache.get('key0'))
+        self.assertIsNone(cache.get('key49'))
+
+
+class TwoLevelCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal = f'{self.directory}/cache.journal'
+        settings = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+            'shared': {
+                'BACKEND': 'core.cache.SQLiteCache',
+                'LOCATION': f'{self.directory}/cache.sqlite3',
+            },
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.cache = TwoLevelCache(self.journal, {'OPTIONS': {
+            'SHARED': 'shared', 'LOCAL_PREFIXES': ['hot:']}})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_hot_keys_are_read_from_memory(self):
+        self.cache.set('hot:key', 1)
+        self.cache.set('cold:key', 1)
+        self.cache.get_many(['hot:key', 'cold:key'])
+        self.cache.shared.clear()
+        self.assertEqual(self.cache.get('hot:key'), 1)
+        self.assertIsNone(self.cache.get('cold:key'))
+
+    def test_writes_in_other_process_invalidate_memory(self):
+        self.cache.set('hot:key', 'старое')
+        self.assertEqual(self.cache.get('hot:key'), 'старое')
+        worker = multiprocessing.get_context('fork').Process(
+            target=_set_value, args=(self.journal, 'новое'))
+        worker.start()
+        worker.join()
+        self.assertEqual(self.cache.get('hot:key'), 'новое')
+
+    def test_incr_invalidates_memory(self):
+        self.cache.set('hot:counter', 1)
+        self.cache.get('hot:counter')
+        self.cache.incr('hot:counter')
+        self.assertEqual(self.cache.get('hot:counter'), 2)
+
+    def test_rotated_journal_drops_memory(self):
+        self.cache.set('hot:key', 1)
+        self.cache.get('hot:key')
+        self.cache.shared.set('hot:key', 2)
+        self.cache._journal.rotate()
+        self.assertEqual(self.cache.get('hot:key'), 2)
+
+
+class QueryBudgetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(6):
+            author = get_user_model().objects.create_user(f'author{number}')
+            Post.objects.create(text=f'Пост {number}', author=author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_shape_ignores_numbers_and_list_lengths(self):
+        self.assertEqual(
+            shape('SELECT a FROM t WHERE id IN (%s, %s) LIMIT 21'),
+            shape('SELECT a FROM t WHERE id IN (%s, %s, %s) LIMIT 10'),
+        )
+
+    def test_n_plus_one_points_to_template_line(self):
+        template = Template(
+            '{% for post in posts %}\n'
+            '{{ post.author.username }}\n'
+            '{% endfor %}')
+        with self.assertRaisesMessage(QueryBudgetExceeded, ':2'):
+            with assert_budget():
+                template.render(Context({'posts': Post.objects.all()}))
+        with assert_budget(2):
+            template.render(Context(
+                {'posts': Post.objects.select_related('author')}))
+
+    def test_cache_fill_is_counted_but_tolerated(self):
+        with recording() as report, cache_fill():
+            for post in Post.objects.all():
+                post.author.username
+        self.assertEqual(report.count, 7)
+        self.assertIn('N+1', report.problems()[0])
+        self.assertEqual(report.problems(filled=False), [])
+
+    @override_settings(
+        QUERY_BUDGET_MODE='raise', QUERY_BUDGETS={'posts:index': 1})
+    def test_page_over_budget_fails(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'бюджете 1'):
+            self.client.get(reverse('posts:index'))
+
+    @override_settings(
+        QUERY_BUDGET_MODE='log', QUERY_BUDGETS={'api_v1:posts': 0})
+    def test_streamed_response_is_checked_when_read(self):
+        response = self.client.get(reverse('api_v1:posts'))
+        with self.assertLogs('core.query_budget', 'WARNING') as logs:
+            b''.join(response.streaming_content)
+        self.assertIn('/api/v1/posts/', logs.output[0])
@@ -1,8 +1,67 @@
 from django.contrib import admin
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from . import export, search
+from .caching import generations
 from .models import Post, Group, Comment, Follow
+from .paginator import EstimatedCountPaginator
 
+CHOICES_KEY = 'posts:choices:{}:{}'
+CONTENT_TYPES = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv'}
 
-class PostAdmin(admin.ModelAdmin):
+
+def export_action(fmt):
+    def action(modeladmin, request, queryset):
+        kind = export.kind_for(queryset.model)
+        response = StreamingHttpResponse(
+            export.lines(queryset, kind, fmt),
+            content_type=f'{CONTENT_TYPES[fmt]}; charset=utf-8',
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{kind.name}.{fmt}"')
+        return response
+
+    action.__name__ = f'export_{fmt}'
+    action.short_description = f'Выгрузить выбранные в {fmt.upper()}'
+    return action
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Общие настройки списков для таблиц на миллионы строк.
+
+    Выбранные строки выгружаются потоком, как manage.py export.
+    Число записей — оценка или ограниченный кэшированный COUNT(*),
+    без второго COUNT(*) всей таблицы при поиске. Поля внешних
+    ключей из cached_choice_fields получают готовый список выбора
+    из кэша: в list_editable форма строится на каждую строку,
+    и без этого каждая строка заново читала бы всю таблицу.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    cached_choice_fields = ()
+    actions = [export_action(fmt) for fmt in export.FORMATS]
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs)
+        if (formfield is not None
+                and db_field.name in self.cached_choice_fields):
+            formfield.choices = self.cached_choices(db_field, formfield)
+        return formfield
+
+    @staticmethod
+    def cached_choices(db_field, formfield):
+        table = db_field.related_model._meta.db_table
+        key = CHOICES_KEY.format(table, *generations(table))
+        choices = cache.get(key)
+        if choices is None:
+            choices = list(formfield.choices)
+            cache.set(key, choices)
+        return choices
+
+
+class PostAdmin(LargeTableAdmin):
     list_display = (
         'pk',
         'text',
@@ -10,11 +69,25 @@ class PostAdmin(admin.ModelAdmin):
         'author',
         'group',
     )
+    list_select_related = ('author', 'group')
     list_editable = ('group',)
+    cached_choice_fields = ('group',)
+    autocomplete_fields = ('author',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # вместо LIKE '%слово%' по всей таблице — индекс FTS5
+        if not search_term or not search.available():
+            return super().get_search_results(
+                request, queryset, search_term)
+        if not search.match_expression(search_term):
+            return queryset.none(), False
+        queryset = queryset.filter(pk__in=search.matching_ids(search_term))
+        return queryset, False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = (
@@ -29,7 +102,7 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = (
         'pk',
         'post',
@@ -37,20 +110,26 @@ class CommentAdmin(admin.ModelAdmin):
         'text',
         'created',
     )
+    list_select_related = ('post', 'author')
     list_editable = ('text',)
-    search_fields = ('post',)
-    list_filter = ('author',)
+    raw_id_fields = ('post',)
+    autocomplete_fields = ('author',)
+    search_fields = ('^author__username', 'text')
+    list_filter = ('created',)
     empty_value_display = '-пусто-'
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdmin):
     list_display = (
         'pk',
         'user',
         'author',
     )
-    search_fields = ('user',)
-    list_filter = ('author',)
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    # без фильтра по автору: он выводил бы всех пользователей сайта,
+    # искать по префиксу имени дешевле
+    search_fields = ('^user__username', '^author__username')
 
 
 admin.site.register(Post, PostAdmin)
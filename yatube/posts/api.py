@@ -0,0 +1,149 @@
+import json
+
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+
+from . import conditional
+from .models import Comment, Group, Post, User
+from .paginator import NEXT, decode_cursor, keyset, make_cursor
+
+# только эти колонки: values() не собирает модели и не тянет лишнего
+POST_FIELDS = (
+    'id', 'text', 'pub_date', 'image', 'comment_count',
+    'author__username', 'group__slug',
+)
+COMMENT_FIELDS = ('id', 'text', 'created', 'author__username')
+JSON_TYPE = 'application/json'
+
+_image_storage = Post._meta.get_field('image').storage
+
+
+def dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def serialize_post(row):
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'pub_date': row['pub_date'].isoformat(),
+        'author': row['author__username'],
+        'group': row['group__slug'],
+        'image': _image_storage.url(row['image']) if row['image'] else None,
+        'comments': row['comment_count'],
+    }
+
+
+def serialize_comment(row):
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'created': row['created'].isoformat(),
+        'author': row['author__username'],
+    }
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        limit = settings.API_PAGE_SIZE
+    return max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+
+
+
+def _stream(rows, serialize, field, limit):
+    """{"results":[...],"next":курсор} по частям, по мере чтения строк.
+
+    Строк читается limit + 1: лишняя только говорит, что дальше
+    есть ещё, и курсор строится по последней отданной.
+    """
+    yield '{"results":['
+    last = next_cursor = None
+    for number, row in enumerate(rows):
+        if number == limit:
+            next_cursor = make_cursor(NEXT, last[field], last['id'])
+            break
+        yield (',' if number else '') + dumps(serialize(row))
+        last = row
+    yield '],"next":' + dumps(next_cursor) + '}'
+
+
+def stream_page(request, queryset, fields, serialize, field='pub_date',
+                descending=True):
+    """Ответ API со страницей queryset по курсору из ?cursor=."""
+    decoded = decode_cursor(request.GET.get('cursor'))
+    # API листает только вперёд: курсор «назад» от общего пагинатора
+    # не должен молча отдавать первую страницу
+    if decoded and decoded[0] != NEXT:
+        return bad_request('Курсор назад не поддерживается')
+    limit = _limit(request)
+    rows = keyset(
+        queryset, decoded[1:] if decoded else None,
+        field=field, descending=descending,
+    ).values(*fields)[:limit + 1]
+    return StreamingHttpResponse(
+        _stream(rows.iterator(), serialize, field, limit),
+        content_type=JSON_TYPE,
+    )
+
+
+def not_found():
+    return JsonResponse({'detail': 'Не найдено'}, status=404)
+
+
+def bad_request(detail):
+    return JsonResponse({'detail': detail}, status=400)
+
+
+@require_safe
+@conditional.conditional_page(
+    conditional.all_posts, Post, Group, Comment, User)
+def posts(request):
+    return stream_page(
+        request, conditional.all_posts(request), POST_FIELDS, serialize_post)
+
+
+@require_safe
+@conditional.conditional_page(
+    conditional.group_posts, Post, Group, Comment, User)
+def group_posts(request, slug):
+    if not Group.objects.filter(slug=slug).exists():
+        return not_found()
+    return stream_page(
+        request, conditional.group_posts(request, slug),
+        POST_FIELDS, serialize_post)
+
+
+@require_safe
+@conditional.conditional_page(
+    conditional.author_posts, Post, Group, Comment, User)
+def author_posts(request, username):
+    if not User.objects.filter(username=username).exists():
+        return not_found()
+    return stream_page(
+        request, conditional.author_posts(request, username),
+        POST_FIELDS, serialize_post)
+
+
+@require_safe
+def post_detail(request, post_id):
+    row = Post.objects.filter(pk=post_id).values(*POST_FIELDS).first()
+    if row is None:
+        return not_found()
+    return JsonResponse(
+        serialize_post(row), json_dumps_params={
+            'ensure_ascii': False, 'separators': (',', ':')})
+
+
+@require_safe
+@conditional.conditional_page(
+    conditional.post_comments, Comment, User, field='created')
+def post_comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        return not_found()
+    return stream_page(
+        request, conditional.post_comments(request, post_id),
+        COMMENT_FIELDS, serialize_comment, field='created', descending=False)
@@ -0,0 +1,260 @@
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import caching, counters, feeds, media, pages, search, timeline
+from .models import Comment, Follow, Group, Post, User
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(row, max_length=None):
+    text = row.get('text')
+    if not isinstance(text, str) or not text.strip():
+        raise RowError('пустой text')
+    if max_length and len(text) > max_length:
+        raise RowError(f'text длиннее {max_length} символов')
+    return text
+
+
+def _date(row, field):
+    value = row.get(field)
+    if value is None:
+        return timezone.now()
+    date = parse_datetime(value) if isinstance(value, str) else None
+    if date is None:
+        raise RowError(f'{field} не в формате ISO 8601')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def _id(row, field):
+    value = row.get(field)
+    if not isinstance(value, int) or value <= 0:
+        raise RowError(f'{field} должен быть положительным целым')
+    return value
+
+
+@contextmanager
+def historical_dates(*fields):
+    """auto_now_add переписал бы даты из файла текущим временем."""
+    saved = [(field, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in saved:
+            field.auto_now_add = value
+
+
+def historical_fields():
+    return (
+        Post._meta.get_field('pub_date'),
+        Comment._meta.get_field('created'),
+    )
+
+
+@contextmanager
+def deferred_indexes(enabled, stdout):
+    """Снимает вторичные индексы и индекс поиска на время загрузки.
+
+    Вставка в таблицу без индексов не перестраивает их на каждой
+    строке; в конце каждый индекс строится один раз по готовым данным.
+    """
+    models = (Post, Comment)
+    if not enabled:
+        yield
+        return
+    with connection.schema_editor() as editor:
+        for model in models:
+            for index in model._meta.indexes:
+                editor.remove_index(model, index)
+        if search.available():
+            if search.missing_triggers():
+                stdout.write(
+                    'Триггеры поиска пропали, индекс будет пересоздан')
+            for sql in search.DROP_SQL:
+                editor.execute(sql)
+    try:
+        yield
+    finally:
+        started = time.perf_counter()
+        with connection.schema_editor() as editor:
+            for model in models:
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+            if search.available():
+                for sql in search.CREATE_SQL:
+                    editor.execute(sql)
+        stdout.write(
+            f'Индексы построены за {time.perf_counter() - started:.1f} с')
+
+
+class Importer:
+    """Проверяет строки пачки и пишет их bulk_create в одной транзакции.
+
+    Имена авторов и slug групп переводятся в id одним запросом
+    на пачку и запоминаются. Посты сохраняют id из файла — по нему
+    на них ссылаются комментарии.
+    """
+
+    def __init__(self, create_users):
+        self.create_users = create_users
+        self.users = {}
+        self.groups = {}
+        self.post_ids = set()
+        self.created = {'post': 0, 'comment': 0, 'follow': 0}
+        self.errors = []
+        self.authors, self.group_ids, self.images = set(), set(), {}
+        self.commented, self.follows = set(), set()
+        # (id, pub_date) новых постов по авторам — для раскладки по лентам
+        self.timeline_posts = {}
+        self.text_length = Post._meta.get_field('text').max_length
+
+    def write(self, batch):
+        self._resolve(batch)
+        posts, comments, follows = [], [], []
+        stored = self._stored_posts(batch)
+        for number, row in batch:
+            try:
+                kind = row.get('type')
+                if kind == 'post':
+                    posts.append(self._post(row, stored))
+                elif kind == 'comment':
+                    comments.append(self._comment(row, stored))
+                elif kind == 'follow':
+                    follows.append(self._follow(row))
+                else:
+                    raise RowError(f'неизвестный type {kind!r}')
+            except RowError as error:
+                self.errors.append((number, str(error)))
+        with transaction.atomic():
+            Post.objects.bulk_create(posts)
+            Comment.objects.bulk_create(comments)
+            Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        for post in posts:
+            self.authors.add(post.author_id)
+            self.group_ids.add(post.group_id)
+            self.timeline_posts.setdefault(post.author_id, []).append(
+                (post.pk, post.pub_date))
+            name = post.image.name
+            if name:
+                self.images[name] = self.images.get(name, 0) + 1
+        self.commented.update(comment.post_id for comment in comments)
+        self.follows.update(
+            (follow.user_id, follow.author_id) for follow in follows)
+        self.created['post'] += len(posts)
+        self.created['comment'] += len(comments)
+        self.created['follow'] += len(follows)
+
+    def finish(self):
+        """Всё, что при save() сделали бы сигналы, — разом в конце.
+
+        Сверка счётчиков и ленты трогают только затронутые импортом
+        строки, а не всю базу.
+        """
+        if not any(self.created.values()):
+            return
+        user_ids = set(self.authors)
+        for pair in self.follows:
+            user_ids.update(pair)
+        counters.reconcile(
+            user_ids=user_ids,
+            group_ids=self.group_ids - {None},
+            post_ids=self.commented,
+        )
+        if feeds.uses_timeline():
+            with transaction.atomic():
+                for author_id, posts in self.timeline_posts.items():
+                    timeline.fan_out_many(author_id, posts)
+                for user_id, author_id in self.follows:
+                    timeline.backfill(user_id, author_id)
+        for name, count in self.images.items():
+            media.retain(name, count)
+        for author_id in self.authors:
+            feeds.forget_author(author_id)
+        for model in (Post, Comment, Follow):
+            caching.bump_generation(model._meta.db_table)
+        pages.bulk_changed(self.authors, self.group_ids)
+
+    def _resolve(self, batch):
+        usernames, slugs = set(), set()
+        for _, row in batch:
+            for field in ('author', 'user'):
+                if isinstance(row.get(field), str):
+                    usernames.add(row[field])
+            if isinstance(row.get('group'), str):
+                slugs.add(row['group'])
+        usernames -= self.users.keys()
+        slugs -= self.groups.keys()
+        if usernames:
+            self.users.update(User.objects.filter(
+                username__in=usernames).values_list('username', 'pk'))
+            missing = usernames - self.users.keys()
+            if missing and self.create_users:
+                User.objects.bulk_create(
+                    User(username=name, password=make_password(None))
+                    for name in missing)
+                self.users.update(User.objects.filter(
+                    username__in=missing).values_list('username', 'pk'))
+        if slugs:
+            self.groups.update(Group.objects.filter(
+                slug__in=slugs).values_list('slug', 'pk'))
+
+    def _stored_posts(self, batch):
+        """Какие id постов из пачки (своих и из комментариев) уже в базе."""
+        wanted = {
+            row.get('id' if row.get('type') == 'post' else 'post')
+            for _, row in batch if row.get('type') in ('post', 'comment')
+        }
+        wanted = [
+            pk for pk in wanted - self.post_ids if isinstance(pk, int)]
+        return set(Post.objects.filter(
+            pk__in=wanted).values_list('pk', flat=True))
+
+    def _user(self, row, field):
+        user_id = self.users.get(row.get(field))
+        if user_id is None:
+            raise RowError(f'нет пользователя {row.get(field)!r}')
+        return user_id
+
+    def _post(self, row, stored):
+        pk = _id(row, 'id')
+        if pk in self.post_ids or pk in stored:
+            raise RowError(f'пост {pk} уже есть')
+        group_id = None
+        if row.get('group') is not None:
+            group_id = self.groups.get(row['group'])
+            if group_id is None:
+                raise RowError(f'нет группы {row["group"]!r}')
+        post = Post(
+            pk=pk, text=_text(row, self.text_length),
+            author_id=self._user(row, 'author'), group_id=group_id,
+            pub_date=_date(row, 'pub_date'), image=row.get('image') or '',
+        )
+        self.post_ids.add(pk)
+        return post
+
+    def _comment(self, row, stored):
+        post_id = _id(row, 'post')
+        if post_id not in self.post_ids and post_id not in stored:
+            raise RowError(f'нет поста {post_id}')
+        return Comment(
+            post_id=post_id, text=_text(row),
+            author_id=self._user(row, 'author'),
+            created=_date(row, 'created'),
+        )
+
+    def _follow(self, row):
+        user_id, author_id = self._user(row, 'user'), self._user(row, 'author')
+        if user_id == author_id:
+            raise RowError('подписка на самого себя')
+        return Follow(user_id=user_id, author_id=author_id)
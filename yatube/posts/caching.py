@@ -0,0 +1,185 @@
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+GENERATION_KEY = 'posts:generation:{}'
+CHANGED_KEY = 'posts:changed:{}'
+LOCK_KEY = 'posts:lock:{}'
+METRIC_KEY = 'posts:swr:{}:{}'
+METRICS = ('hits', 'stale', 'misses', 'recomputes', 'recompute_ms')
+
+# счётчики копятся в памяти процесса и уходят в общий кэш пачкой:
+# incr на каждое попадание брал бы блокировку записи файла кэша
+_pending = Counter()
+_pending_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def _initial_generation():
+    # после вытеснения ключа поколение не должно вернуться к старому
+    # значению, иначе ожили бы устаревшие записи
+    return int(time.time() * 1000)
+
+
+def generations(*tables):
+    """Текущие номера поколений таблиц, в порядке аргументов."""
+    keys = [GENERATION_KEY.format(table) for table in tables]
+    found = cache.get_many(keys)
+    missing = {
+        key: _initial_generation() for key in keys if key not in found
+    }
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump_generation(table):
+    """Сбрасывает фрагменты таблицы сейчас и ещё раз после коммита.
+
+    Между записью и коммитом другой воркер ещё видит старые строки и
+    может положить их в кэш под уже новым поколением; повтор после
+    коммита отсекает и такие записи.
+    """
+    _bump(table)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(table))
+
+
+def _bump(table):
+    key = GENERATION_KEY.format(table)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_generation(), None)
+    cache.set(CHANGED_KEY.format(table), timezone.now(), None)
+
+
+def changed_at(*tables):
+    """Время последней записи в любую из таблиц.
+
+    Если отметка пропала из кэша, считаем, что запись была только что:
+    лишний 200 безопаснее, чем 304 на устаревшую страницу.
+    """
+    keys = [CHANGED_KEY.format(table) for table in tables]
+    found = cache.get_many(keys)
+    now = timezone.now()
+    missing = {key: now for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return max(found.values())
+
+
+def fragment_context(*models):
+    """Контекст для {% swrcache %} вокруг лент.
+
+    fragment_version меняется при любой записи в таблицы models,
+    поэтому фрагменты можно держать часами: запись со старой версией
+    пересобирается при следующем запросе.
+    """
+    version = generations(*(model._meta.db_table for model in models))
+    return {
+        'fragment_version': '.'.join(map(str, version)),
+        'fragment_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+    }
+
+
+def _record(name, metric, amount=1):
+    with _pending_lock:
+        _pending[name, metric] += amount
+        due = (time.monotonic() - _flushed_at
+               >= settings.SWR_METRICS_FLUSH_INTERVAL)
+    if due:
+        flush_metrics()
+
+
+def flush_metrics():
+    """Переносит накопленные процессом счётчики в общий кэш."""
+    global _flushed_at
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _flushed_at = time.monotonic()
+    for (name, metric), amount in pending.items():
+        key = METRIC_KEY.format(name, metric)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            if not cache.add(key, amount, None):
+                cache.incr(key, amount)
+
+
+def swr_metrics(name):
+    """Счётчики фрагмента name: попадания, устаревшие ответы, пересборки.
+
+    Свои накопленные значения процесс сначала сбрасывает в кэш;
+    чужие видны с задержкой до SWR_METRICS_FLUSH_INTERVAL.
+    """
+    flush_metrics()
+    keys = [METRIC_KEY.format(name, metric) for metric in METRICS]
+    found = cache.get_many(keys)
+    return {
+        metric: found.get(key, 0) for metric, key in zip(METRICS, keys)
+    }
+
+
+def _expires_early(entry, now):
+    """Вероятностное раннее истечение (XFetch).
+
+    Чем ближе срок и чем дольше шла прошлая пересборка, тем вероятнее,
+    что запрос возьмётся за неё заранее, пока остальные получают
+    ещё свежее значение, — и срок не наступает у всех разом.
+    """
+    gap = entry['delta'] * settings.SWR_BETA * -math.log(
+        1.0 - random.random())
+    return now + gap >= entry['expires']
+
+
+def stale_while_revalidate(key, compute, timeout, version=None, name=None):
+    """Значение из кэша с пересборкой одним воркером.
+
+    Запись хранится дольше своего срока (на SWR_STALE_TIMEOUT). Когда
+    срок вышел или сменилась version, пересобирает только тот, кто
+    взял блокировку через cache.add; остальные тем временем отдают
+    устаревшее значение. Без значения и без блокировки считаем сами,
+    но в кэш не пишем — это сделает владелец блокировки.
+    """
+    name = name or key
+    entry = cache.get(key)
+    now = time.time()
+    if (entry is not None and entry['version'] == version
+            and not _expires_early(entry, now)):
+        _record(name, 'hits')
+        return entry['value']
+    lock, token = LOCK_KEY.format(key), uuid.uuid4().hex
+    if not cache.add(lock, token, settings.SWR_LOCK_TIMEOUT):
+        if entry is not None:
+            _record(name, 'stale')
+            return entry['value']
+        _record(name, 'misses')
+        return compute()
+    try:
+        started = time.monotonic()
+        value = compute()
+        delta = time.monotonic() - started
+        cache.set(key, {
+            'value': value,
+            'version': version,
+            'delta': delta,
+            'expires': time.time() + timeout,
+        }, timeout + settings.SWR_STALE_TIMEOUT)
+    finally:
+        if cache.get(lock) == token:
+            cache.delete(lock)
+    _record(name, 'recomputes')
+    _record(name, 'recompute_ms', round(delta * 1000))
+    return value
@@ -0,0 +1,79 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .thumbnails import prefetch
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+
+def card_key(post, truncate=None):
+    """Ключ карточки: id поста и отпечаток всего, что в ней выводится.
+
+    Правка поста, смена группы или имени автора дают новый ключ,
+    так что отдельная инвалидация не нужна: старая карточка просто
+    вытесняется по таймауту. truncate — сколько слов текста показать,
+    None — весь текст.
+    """
+    author = post.author
+    group = post.group
+    fingerprint = repr((
+        post.text, post.pub_date, post.image.name,
+        author.username, author.get_full_name(),
+        group and (group.slug, group.title), truncate,
+    ))
+    digest = hashlib.md5(fingerprint.encode()).hexdigest()
+    return f'posts:card:{post.pk}:{digest}'
+
+
+class PageCards:
+    """Карточки постов страницы, загружаемые одним get_many.
+
+    Загрузка ленивая: если лента отдана из кэша фрагментов,
+    к кэшу карточек никто не обращается.
+    """
+
+    def __init__(self, posts, truncate=None):
+        self.posts = list(posts)
+        self.truncate = truncate
+        self.rendered = None
+
+    def get(self, post):
+        if self.rendered is None:
+            self.rendered = self._load()
+        return self.rendered[post.pk]
+
+    def _load(self):
+        keys = {card_key(post, self.truncate): post for post in self.posts}
+        found = cache.get_many(keys)
+        prefetch([post for key, post in keys.items() if key not in found])
+        missing = {
+            key: render_to_string(
+                CARD_TEMPLATE, {'post': post, 'truncate': self.truncate})
+            for key, post in keys.items() if key not in found
+        }
+        if missing:
+            cache.set_many(missing, settings.CARD_CACHE_TIMEOUT)
+            found.update(missing)
+        return {post.pk: found[key] for key, post in keys.items()}
+
+
+class Card:
+    def __init__(self, cards, post):
+        self.cards = cards
+        self.post = post
+
+    def __html__(self):
+        return self.cards.get(self.post)
+
+    __str__ = __html__
+
+
+def attach_cards(posts, truncate=None):
+    """Вешает на каждый пост атрибут card для {{ post.card }}."""
+    cards = PageCards(posts, truncate)
+    for post in cards.posts:
+        post.card = Card(cards, post)
+    return posts
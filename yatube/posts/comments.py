@@ -0,0 +1,26 @@
+from django.conf import settings
+
+from .models import Comment
+from .paginator import NEXT, decode_cursor, encode_cursor, keyset
+
+
+def comment_chunk(post_id, cursor=None, size=None):
+    """Порция комментариев поста от старых к новым и курсор следующей.
+
+    Ключ — (created, id) по индексу comment_post_created_idx: порция
+    из глубины обсуждения стоит столько же, сколько первая. Авторы
+    подгружаются тем же запросом.
+    """
+    size = size or settings.COMMENTS_PER_CHUNK
+    decoded = decode_cursor(cursor)
+    key = decoded[1:] if decoded and decoded[0] == NEXT else None
+    queryset = keyset(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        key, field='created', descending=False,
+    )
+    rows = list(queryset[:size + 1])
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor(NEXT, rows[-1], field='created')
+    return rows, next_cursor
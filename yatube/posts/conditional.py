@@ -0,0 +1,64 @@
+import hashlib
+
+from django.db.models import Max
+from django.views.decorators.http import condition
+
+from .caching import changed_at, generations
+from .feeds import uses_timeline
+from .models import Comment, Post, Timeline
+
+
+def conditional_page(slice_for, *models, field='pub_date'):
+    """ETag и Last-Modified для страницы до её сборки.
+
+    slice_for(request, **kwargs) возвращает queryset показываемых
+    записей; по нему одним индексным MAX(field) берётся дата последней
+    записи. Правки и удаления, которых MAX не видит, учитываются через
+    поколения и отметки времени таблиц models.
+    """
+    tables = [model._meta.db_table for model in models]
+
+    def marker(request, *args, **kwargs):
+        if not hasattr(request, '_page_marker'):
+            latest = slice_for(request, *args, **kwargs).aggregate(
+                latest=Max(field))['latest']
+            changed = changed_at(*tables)
+            request._page_marker = (
+                latest, changed, generations(*tables))
+        return request._page_marker
+
+    def etag(request, *args, **kwargs):
+        latest, _, versions = marker(request, *args, **kwargs)
+        signature = repr((
+            request.path, request.GET.urlencode(), request.user.pk,
+            latest, versions,
+        ))
+        return hashlib.md5(signature.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        latest, changed, _ = marker(request, *args, **kwargs)
+        return max(filter(None, (latest, changed)))
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def all_posts(request):
+    return Post.objects.all()
+
+
+def group_posts(request, slug):
+    return Post.objects.filter(group__slug=slug)
+
+
+def author_posts(request, username):
+    return Post.objects.filter(author__username=username)
+
+
+def post_comments(request, post_id):
+    return Comment.objects.filter(post_id=post_id)
+
+
+def followed_posts(request):
+    if uses_timeline():
+        return Timeline.objects.filter(user=request.user)
+    return Post.objects.filter(author__following__user=request.user)
@@ -0,0 +1,128 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+CHUNK_SIZE = 500
+
+
+def user_stats(user):
+    """Счётчики пользователя; для новичка без строки — нули без записи."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def _not_below_zero(deltas):
+    # счётчики беззнаковые: уменьшение уже нулевого ждёт сверки
+    return {
+        f'{field}__gte': -delta for field, delta in deltas.items()
+        if delta < 0
+    }
+
+
+def bump_user(user_id, **deltas):
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    with transaction.atomic():
+        if UserStats.objects.filter(
+                user_id=user_id, **_not_below_zero(deltas)).update(**changes):
+            return
+        # строки нет: для уменьшения создавать нечего, сверка поправит
+        if any(delta < 0 for delta in deltas.values()):
+            return
+        try:
+            with transaction.atomic():
+                UserStats.objects.create(user_id=user_id, **deltas)
+        except IntegrityError:
+            UserStats.objects.filter(user_id=user_id).update(**changes)
+
+
+def bump_group(group_id, delta):
+    if group_id is not None:
+        Group.objects.filter(
+            pk=group_id, **_not_below_zero({'post_count': delta})
+        ).update(post_count=F('post_count') + delta)
+
+
+def bump_post(post_id, delta):
+    Post.objects.filter(
+        pk=post_id, **_not_below_zero({'comment_count': delta})
+    ).update(comment_count=F('comment_count') + delta)
+
+
+def _count(queryset, field):
+    """Подзапрос COUNT(*) по queryset, сгруппированному по field."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def reconcile(user_ids=None, group_ids=None, post_ids=None):
+    """Пересчитывает счётчики набором UPDATE ... SET = (подзапрос).
+
+    Без аргументов сверяются все строки; переданные id сужают сверку
+    своей таблицы до них, пустой набор её пропускает. Обновляются
+    только разошедшиеся строки; возвращает их число по каждой таблице.
+    """
+    with transaction.atomic():
+        missing = User.objects.filter(stats__isnull=True)
+        UserStats.objects.bulk_create(
+            (
+                UserStats(user_id=pk)
+                for ids in _chunks(user_ids)
+                for pk in _only(missing, ids).values_list('pk', flat=True)
+            ),
+            batch_size=CHUNK_SIZE,
+            ignore_conflicts=True,
+        )
+        return {
+            'users': _fix(UserStats.objects.all(), user_ids, {
+                'post_count': _count(Post.objects.all(), 'author'),
+                'follower_count': _count(Follow.objects.all(), 'author'),
+                'following_count': _count(Follow.objects.all(), 'user'),
+            }),
+            'groups': _fix(Group.objects.all(), group_ids, {
+                'post_count': _count(Post.objects.all(), 'group'),
+            }),
+            'posts': _fix(Post.objects.all(), post_ids, {
+                'comment_count': _count(Comment.objects.all(), 'post'),
+            }),
+        }
+
+
+def _chunks(ids):
+    """id по CHUNK_SIZE: длинный IN упрётся в лимит параметров SQLite."""
+    if ids is None:
+        yield None
+        return
+    ids = sorted(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def _only(queryset, ids):
+    return queryset if ids is None else queryset.filter(pk__in=ids)
+
+
+def _fix(queryset, ids, actual):
+    annotations = {f'actual_{field}': value for field, value in actual.items()}
+    in_sync = Q(**{field: F(f'actual_{field}') for field in actual})
+    drifted = 0
+    for chunk in _chunks(ids):
+        rows = _only(queryset, chunk)
+        stale = rows.annotate(**annotations).filter(~in_sync).values('pk')
+        count = stale.count()
+        if count:
+            rows.filter(pk__in=stale).update(**actual)
+        drifted += count
+    return drifted
@@ -0,0 +1,122 @@
+import csv
+import gzip
+import json
+from collections import namedtuple
+
+from .models import Comment, Follow, Post
+
+# строки JSONL совпадают с форматом import_posts: выгрузку можно
+# загрузить обратно; columns — (имя в выгрузке, поле для values_list)
+Kind = namedtuple('Kind', 'name type model columns')
+
+KINDS = {
+    kind.name: kind for kind in (
+        Kind('posts', 'post', Post, (
+            ('id', 'id'),
+            ('author', 'author__username'),
+            ('group', 'group__slug'),
+            ('text', 'text'),
+            ('pub_date', 'pub_date'),
+            ('image', 'image'),
+        )),
+        Kind('comments', 'comment', Comment, (
+            ('id', 'id'),
+            ('post', 'post_id'),
+            ('author', 'author__username'),
+            ('text', 'text'),
+            ('created', 'created'),
+        )),
+        Kind('follows', 'follow', Follow, (
+            ('id', 'id'),
+            ('user', 'user__username'),
+            ('author', 'author__username'),
+        )),
+    )
+}
+FORMATS = ('jsonl', 'csv')
+
+
+def kind_for(model):
+    return next(kind for kind in KINDS.values() if kind.model is model)
+
+
+def _plain(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+class _Echo:
+    """Файл для csv.writer, который просто возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def rows(queryset, kind, chunk_size=2000, start=None, stop=None):
+    """Кортежи значений columns по возрастанию id, id из (start, stop].
+
+    Каждая порция — отдельный запрос «id > последнего» по первичному
+    ключу: ни OFFSET, ни курсора, открытого на всю выгрузку, и в
+    памяти не больше chunk_size строк.
+    """
+    fields = [field for _, field in kind.columns]
+    queryset = queryset.order_by('pk')
+    if stop is not None:
+        queryset = queryset.filter(pk__lte=stop)
+    last = start
+    while True:
+        chunk = queryset if last is None else queryset.filter(pk__gt=last)
+        count = 0
+        for row in chunk.values_list(*fields)[:chunk_size].iterator(
+                chunk_size=chunk_size):
+            count += 1
+            yield row
+        if count < chunk_size:
+            return
+        last = row[0]
+
+
+def lines(queryset, kind, fmt, chunk_size=2000, start=None, stop=None,
+          header=True):
+    """Строки выгрузки в формате fmt, каждая с переводом строки."""
+    names = [name for name, _ in kind.columns]
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        if header:
+            yield writer.writerow(names)
+        for row in rows(queryset, kind, chunk_size, start, stop):
+            yield writer.writerow([_plain(value) for value in row])
+        return
+    for row in rows(queryset, kind, chunk_size, start, stop):
+        record = {'type': kind.type}
+        record.update(zip(names, map(_plain, row)))
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def id_ranges(model, parts):
+    """Делит id таблицы на parts диапазонов (start, stop]."""
+    ids = model.objects.order_by('pk').values_list('pk', flat=True)
+    first, last = ids.first(), ids.last()
+    if first is None:
+        return []
+    span = last - first + 1
+    bounds = [first - 1 + span * number // parts for number in range(parts)]
+    return list(zip(bounds, bounds[1:] + [last]))
+
+
+def open_output(path, compress):
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def export_range(name, fmt, path, start, stop, chunk_size, compress,
+                 header):
+    """Пишет диапазон id в файл; выполняется и в воркере пула."""
+    kind = KINDS[name]
+    written = 0
+    with open_output(path, compress) as output:
+        for line in lines(kind.model.objects.all(), kind, fmt, chunk_size,
+                          start, stop, header):
+            output.write(line)
+            written += 1
+    return written - (1 if fmt == 'csv' and header else 0)
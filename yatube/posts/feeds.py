@@ -0,0 +1,153 @@
+import heapq
+from itertools import dropwhile, islice, takewhile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from .models import Follow, Post, Timeline
+from .paginator import CursorPaginator, paginate
+
+RECENT_KEY = 'posts:author_recent:{}'
+# последние посты многих авторов одним запросом: оконная функция режет
+# каждого автора до лимита ещё в базе
+RECENT_SQL = (
+    'SELECT id, author_id, pub_date FROM ('
+    'SELECT id, author_id, pub_date, ROW_NUMBER() OVER ('
+    'PARTITION BY author_id ORDER BY pub_date DESC, id DESC) AS position '
+    'FROM {table} WHERE author_id IN ({ids})'
+    ') WHERE position <= %s ORDER BY author_id, pub_date DESC, id DESC'
+)
+# столько id в одном IN: с запасом до лимита параметров SQLite
+RECENT_CHUNK = 500
+
+
+def recent_key(author_id):
+    return RECENT_KEY.format(author_id)
+
+
+def forget_author(author_id):
+    """Сбрасывает последние посты автора сейчас и ещё раз после коммита.
+
+    Лента подписок другого воркера до коммита перечитала бы старые
+    строки и положила их в кэш на FOLLOW_MERGE_TIMEOUT.
+    """
+    key = recent_key(author_id)
+    cache.delete(key)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.delete(key))
+
+
+def recent_post_keys(author_ids):
+    """Списки (pub_date, id) последних постов каждого автора, новые первыми.
+
+    Списки живут в кэше и ограничены FOLLOW_MERGE_RECENT элементами,
+    промахи дочитываются из базы одним запросом на всех и тут же
+    кладутся в кэш.
+    """
+    keys = {recent_key(author_id): author_id for author_id in author_ids}
+    streams = cache.get_many(keys)
+    missing = [
+        author_id for key, author_id in keys.items() if key not in streams]
+    if missing:
+        loaded = {
+            recent_key(author_id): stream
+            for author_id, stream in _load_recent(missing).items()
+        }
+        cache.set_many(loaded, settings.FOLLOW_MERGE_TIMEOUT)
+        streams.update(loaded)
+    return list(streams.values())
+
+
+def _load_recent(author_ids):
+    streams = {author_id: [] for author_id in author_ids}
+    for start in range(0, len(author_ids), RECENT_CHUNK):
+        chunk = author_ids[start:start + RECENT_CHUNK]
+        sql = RECENT_SQL.format(
+            table=Post._meta.db_table, ids=', '.join(['%s'] * len(chunk)))
+        for post in Post.objects.raw(
+                sql, [*chunk, settings.FOLLOW_MERGE_RECENT]):
+            streams[post.author_id].append((post.pub_date, post.pk))
+    return streams
+
+
+class TimelinePaginator(CursorPaginator):
+    """Курсор по (pub_date, id поста), как у остальных движков."""
+
+    pk_field = 'post_id'
+
+
+class MergePaginator(CursorPaginator):
+    """Лента подписок как k-way слияние кэшированных списков авторов.
+
+    Из базы читаются только посты, попавшие на страницу, одним
+    запросом по id. Глубина ленты ограничена FOLLOW_MERGE_RECENT
+    постами на автора.
+    """
+
+    def older_than(self, key, limit):
+        streams = [
+            stream if key is None
+            else dropwhile(lambda item: item >= key, stream)
+            for stream in self.object_list
+        ]
+        return self._hydrate(
+            islice(heapq.merge(*streams, reverse=True), limit))
+
+    def newer_than(self, key, limit):
+        streams = [
+            list(takewhile(lambda item: item > key, stream))[::-1]
+            for stream in self.object_list
+        ]
+        return self._hydrate(islice(heapq.merge(*streams), limit))
+
+    def _hydrate(self, keys):
+        ids = [pk for _, pk in keys]
+        posts = Post.objects.select_related('author', 'group').in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def _join_page(request, per_page):
+    posts = Post.objects.filter(
+        author__following__user=request.user
+    ).select_related('author', 'group')
+    return paginate(request, posts, per_page)
+
+
+def _timeline_page(request, per_page):
+    entries = Timeline.objects.filter(user=request.user).select_related(
+        'post__author', 'post__group')
+    page_obj = paginate(
+        request, entries, per_page, cursor_paginator=TimelinePaginator)
+    page_obj.object_list = [entry.post for entry in page_obj]
+    return page_obj
+
+
+def _merge_page(request, per_page):
+    author_ids = Follow.objects.filter(
+        user=request.user).values_list('author_id', flat=True)
+    paginator = MergePaginator(recent_post_keys(author_ids), per_page)
+    return paginator.get_page(request.GET.get('cursor'))
+
+
+ENGINES = {
+    'join': _join_page,
+    'timeline': _timeline_page,
+    'merge': _merge_page,
+}
+
+
+def follow_page(request, per_page):
+    """Страница ленты подписок движком из FOLLOW_FEED_ENGINE."""
+    try:
+        engine = ENGINES[settings.FOLLOW_FEED_ENGINE]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f'FOLLOW_FEED_ENGINE должен быть одним из: {", ".join(ENGINES)}'
+        )
+    return engine(request, per_page)
+
+
+def uses_timeline():
+    return settings.FOLLOW_FEED_ENGINE == 'timeline'
@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from .models import Post, Comment
+from . import uploads
 
 
 class PostForm(forms.ModelForm):
@@ -7,6 +9,26 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image',)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # файл, обрезанный BoundedUploadHandler, Pillow даже не открывает:
+        # поле его не видит, а ошибку о размере выдаёт clean_image
+        name = self.add_prefix('image')
+        self.oversized = self.files.get(name)
+        if not uploads.is_oversized(self.oversized):
+            self.oversized = None
+        else:
+            self.files = self.files.copy()
+            del self.files[name]
+
+    def clean_image(self):
+        if self.oversized is not None:
+            uploads.check_size(self.oversized)
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            return uploads.normalize(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,216 @@
+import json
+import math
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.cache import isolated_caches
+from posts import urls
+from posts.models import Group, Post, User
+
+# меняют данные: гонять их по кругу значит мерить уже другую базу
+MUTATING = {'add_comment', 'profile_follow', 'profile_unfollow'}
+PERCENTILES = (50, 95, 99)
+# кэши, которые и так живут в памяти одного процесса
+PROCESS_LOCAL = {
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+}
+
+
+def percentile(samples, rank):
+    """Процентиль по ближайшему рангу: одно из измеренных значений."""
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(len(ordered) * rank / 100) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Гоняет страницы posts/urls.py через тестовый клиент и считает '
+        'перцентили времени ответа и число запросов к базе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--user', help='от чьего имени; по умолчанию самый подписанный')
+        parser.add_argument('--anonymous', action='store_true')
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='очищать кеш перед каждым запросом; прогон идёт '
+                 'на временной копии кеша, рабочий не трогается')
+        parser.add_argument('--output', help='куда сохранить JSON')
+        parser.add_argument(
+            '--compare', help='JSON прошлого прогона для сравнения')
+        parser.add_argument(
+            '--threshold', type=float, default=20,
+            help='рост p95 в процентах, который считается регрессией')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должен быть больше нуля')
+        if not options['cold']:
+            self._run(options)
+            return
+        # cache.clear() на рабочем кеше сбросил бы его всем воркерам
+        # вместе с кешем страниц
+        directory = tempfile.mkdtemp(prefix='yatube-benchmark-')
+        try:
+            with override_settings(CACHES=self._cold_caches(directory)):
+                self._run(options)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    @staticmethod
+    def _cold_caches(directory):
+        isolated = isolated_caches(directory)
+        for alias, options in isolated.items():
+            moved = options.get('LOCATION') != settings.CACHES[alias].get(
+                'LOCATION')
+            if not moved and options['BACKEND'] not in PROCESS_LOCAL:
+                raise CommandError(
+                    f'--cold очистил бы общий кеш {alias!r}: '
+                    'нужен файловый LOCATION или кеш в памяти процесса')
+        return isolated
+
+    def _run(self, options):
+        client = self._client(options)
+        results = {
+            'created': timezone.now().isoformat(),
+            'requests': options['requests'],
+            'user': None if options['anonymous'] else self.user.username,
+            'cold': options['cold'],
+            'views': {},
+        }
+        for name, url in self._cases():
+            try:
+                result = self._measure(client, url, options)
+            except Exception as error:
+                # тестовый клиент пробрасывает исключение вида, а не 500;
+                # одна сломанная страница не должна обрывать весь прогон
+                results['views'][name] = {'url': url, 'error': repr(error)}
+                self.stdout.write(self.style.ERROR(f'{name:<16} {error!r}'))
+                continue
+            results['views'][name] = result
+            self.stdout.write(
+                f'{name:<16} {result["status"]} '
+                f'p50 {result["p50_ms"]:7.2f}  p95 {result["p95_ms"]:7.2f}  '
+                f'p99 {result["p99_ms"]:7.2f} мс  '
+                f'запросов {result["queries"]}')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self._compare(results, options['compare'], options['threshold'])
+
+    def _client(self, options):
+        host = next(
+            (host.lstrip('.') for host in settings.ALLOWED_HOSTS
+             if host != '*'), 'localhost')
+        client = Client(SERVER_NAME=host)
+        self.user = None
+        if options['user']:
+            self.user = User.objects.filter(
+                username=options['user']).first()
+            if self.user is None:
+                raise CommandError(f'Нет пользователя {options["user"]}')
+        elif not options['anonymous']:
+            self.user = User.objects.annotate(
+                authors=Count('follower')).order_by('-authors').first()
+        if self.user is None and not options['anonymous']:
+            raise CommandError('В базе нет пользователей, запустите seed')
+        if not options['anonymous']:
+            client.force_login(self.user)
+        return client
+
+    def _cases(self):
+        """(имя, адрес) для каждого маршрута на самых нагруженных данных."""
+        post = Post.objects.order_by('-comment_count', '-pk').first()
+        group = Group.objects.annotate(
+            total=Count('posts')).order_by('-total').first()
+        author = User.objects.annotate(
+            total=Count('posts')).order_by('-total').first()
+        if post is None or group is None:
+            raise CommandError('Нужны посты и группы, запустите seed')
+        values = {
+            'post_id': post.pk,
+            'slug': group.slug,
+            'username': author.username,
+        }
+        query = {'search': '?q=' + post.text.split()[0]}
+        for pattern in urls.urlpatterns:
+            if pattern.name in MUTATING:
+                continue
+            kwargs = {
+                name: values[name] for name in pattern.pattern.converters}
+            name = pattern.name
+            if not kwargs and pattern.name == 'group_posts':
+                name = 'group_list'
+            yield name, (
+                reverse(f'{urls.app_name}:{pattern.name}', kwargs=kwargs)
+                + query.get(pattern.name, ''))
+
+    def _measure(self, client, url, options):
+        for _ in range(options['warmup']):
+            self._get(client, url)
+        timings, queries = [], []
+        for _ in range(options['requests']):
+            if options['cold']:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                status = self._get(client, url)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+        result = {'url': url, 'status': status}
+        for rank in PERCENTILES:
+            result[f'p{rank}_ms'] = round(percentile(timings, rank), 3)
+        result['mean_ms'] = round(statistics.mean(timings), 3)
+        result['queries'] = max(queries)
+        return result
+
+    @staticmethod
+    def _get(client, url):
+        response = client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+    def _compare(self, results, path, threshold):
+        with open(path, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)['views']
+        regressions = []
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Сравнение с {path}'))
+        for name, result in results['views'].items():
+            before = baseline.get(name)
+            if 'error' in result:
+                if before is not None and 'error' not in before:
+                    regressions.append(name)
+                self.stdout.write(self.style.ERROR(f'{name:<16} ошибка'))
+                continue
+            if before is None or 'error' in before:
+                self.stdout.write(f'{name:<16} не с чем сравнить')
+                continue
+            change = (
+                (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+                if before['p95_ms'] else 0)
+            queries = result['queries'] - before['queries']
+            line = f'{name:<16} p95 {change:+6.1f}%  запросов {queries:+d}'
+            if change > threshold or queries > 0:
+                regressions.append(name)
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        if regressions:
+            raise CommandError('Регрессия: ' + ', '.join(regressions))
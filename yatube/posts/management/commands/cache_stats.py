@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import swr_metrics
+
+FRAGMENTS = ('index_page', 'group_page', 'profile_page', 'follow_page')
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и пересборки кэша фрагментов лент'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', default=FRAGMENTS)
+
+    def handle(self, *args, **options):
+        for name in options['names']:
+            metrics = swr_metrics(name)
+            recomputes = metrics['recomputes']
+            average = metrics['recompute_ms'] / recomputes if recomputes else 0
+            self.stdout.write(
+                f"{name}: попаданий {metrics['hits']}, "
+                f"устаревших {metrics['stale']}, "
+                f"промахов {metrics['misses']}, "
+                f"пересборок {recomputes} "
+                f"(в среднем {average:.1f} мс)"
+            )
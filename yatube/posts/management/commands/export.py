@@ -0,0 +1,85 @@
+import os
+import shutil
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+from posts.thumbnails import worker_pool
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты, комментарии или подписки в JSONL или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(export.KINDS))
+        parser.add_argument('--format', choices=export.FORMATS,
+                            default='jsonl')
+        parser.add_argument('--output', help='файл; по умолчанию stdout')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='процессов, каждый выгружает свой диапазон id')
+
+    def handle(self, *args, **options):
+        output, workers = options['output'], options['workers']
+        if workers > 1 and not output:
+            raise CommandError('Для --workers больше 1 нужен --output')
+        if options['gzip'] and not output:
+            raise CommandError('Для --gzip нужен --output')
+        started = time.perf_counter()
+        if not output:
+            kind = export.KINDS[options['kind']]
+            for line in export.lines(
+                    kind.model.objects.all(), kind, options['format'],
+                    options['chunk_size']):
+                sys.stdout.write(line)
+            return
+        if workers > 1:
+            written = self._parallel(options)
+        else:
+            written = export.export_range(
+                options['kind'], options['format'], output, None, None,
+                options['chunk_size'], options['gzip'], True)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгружено строк: {written} за {elapsed:.1f} с, '
+            f'{written / elapsed if elapsed else 0:.0f} строк/с'))
+
+    def _parallel(self, options):
+        """Диапазоны id пишутся в части параллельно и склеиваются по порядку.
+
+        Части gzip склеиваются как есть: несколько gzip-потоков подряд —
+        корректный gzip-файл. Заголовок CSV пишет только первая часть.
+        """
+        output = options['output']
+        ranges = export.id_ranges(
+            export.KINDS[options['kind']].model, options['workers'])
+        if not ranges:
+            return export.export_range(
+                options['kind'], options['format'], output, None, None,
+                options['chunk_size'], options['gzip'], True)
+        parts = [f'{output}.part{number}' for number in range(len(ranges))]
+        try:
+            with worker_pool(options['workers']) as pool:
+                futures = [
+                    pool.submit(
+                        export.export_range, options['kind'],
+                        options['format'], part, start, stop,
+                        options['chunk_size'], options['gzip'], number == 0,
+                    )
+                    for number, (part, (start, stop))
+                    in enumerate(zip(parts, ranges))
+                ]
+                written = sum(future.result() for future in futures)
+            with open(output, 'wb') as target:
+                for part in parts:
+                    with open(part, 'rb') as source:
+                        shutil.copyfileobj(source, target)
+        finally:
+            for part in parts:
+                if os.path.exists(part):
+                    os.remove(part)
+        return written
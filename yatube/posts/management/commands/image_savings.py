@@ -0,0 +1,58 @@
+from collections import Counter
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+
+from posts.models import Post
+from posts.thumbnails import prefetch, variants
+
+
+def _megabytes(size):
+    return f'{size / 1024 / 1024:.2f} МБ'
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает объём оригиналов картинок и вариантов карточек'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=200)
+
+    def handle(self, *args, **options):
+        posts = (
+            Post.objects.exclude(image='').only('pk', 'image')
+            .order_by('pk').iterator(chunk_size=options['batch'])
+        )
+        seen, originals, variant_bytes = set(), 0, Counter()
+        while True:
+            chunk = list(islice(posts, options['batch']))
+            if not chunk:
+                break
+            batch = {
+                post.image.name: post for post in chunk
+                if post.image.name not in seen
+            }
+            seen.update(batch)
+            for post in prefetch(batch.values()):
+                originals += post.image.size
+                for (geometry, _), (thumbnail, image_format) in zip(
+                        variants(), post.image_variants):
+                    variant_bytes[geometry, image_format] += (
+                        default.storage.size(thumbnail.name))
+        self.stdout.write(
+            f'Оригиналы: {len(seen)} файлов, {_megabytes(originals)}')
+        fallback = variants()[0][1].get('format', 'JPEG')
+        for (geometry, image_format), size in variant_bytes.items():
+            line = f'{geometry} {image_format}: {_megabytes(size)}'
+            base = variant_bytes.get((geometry, fallback))
+            if image_format != fallback and base:
+                saved = 100 - 100 * size / base
+                line += f', на {saved:.0f}% меньше {fallback}'
+            self.stdout.write(line)
+        if originals:
+            card = min(size for size in variant_bytes.values())
+            self.stdout.write(self.style.SUCCESS(
+                f'Лента вместо оригиналов отдаёт на '
+                f'{_megabytes(originals - card)} меньше '
+                f'({100 - 100 * card / originals:.0f}%)'
+            ))
@@ -0,0 +1,87 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.bulk import (
+    Importer, deferred_indexes, historical_dates, historical_fields)
+
+SHOWN_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = 'Загружает посты, комментарии и подписки из JSONL пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл JSONL или - для stdin')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--defer-indexes', action='store_true',
+            help='снять вторичные индексы и построить их в конце')
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help='создавать отсутствующих авторов без пароля')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        importer = Importer(options['create_users'])
+        started = time.perf_counter()
+        rows = 0
+        stream = (
+            sys.stdin if options['path'] == '-'
+            else open(options['path'], encoding='utf-8')
+        )
+        try:
+            with deferred_indexes(options['defer_indexes'], self.stdout), \
+                    historical_dates(*historical_fields()):
+                for batch in self._batches(
+                        stream, options['batch_size'], importer):
+                    importer.write(batch)
+                    rows += len(batch)
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f'… {rows} строк, {rows / elapsed:.0f} строк/с')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            # пачки до ошибки уже закоммичены: счётчики, ленты и кэш
+            # должны их учесть, даже если импорт оборвался
+            importer.finish()
+        elapsed = time.perf_counter() - started
+        self._report(importer, rows, elapsed)
+
+    @staticmethod
+    def _batches(stream, size, importer):
+        batch = []
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                importer.errors.append((number, 'не JSON'))
+                continue
+            if not isinstance(row, dict):
+                importer.errors.append((number, 'не объект'))
+                continue
+            batch.append((number, row))
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _report(self, importer, rows, elapsed):
+        for number, message in sorted(importer.errors)[:SHOWN_ERRORS]:
+            self.stderr.write(f'строка {number}: {message}')
+        if len(importer.errors) > SHOWN_ERRORS:
+            self.stderr.write(
+                f'… и ещё ошибок: {len(importer.errors) - SHOWN_ERRORS}')
+        created = importer.created
+        self.stdout.write(self.style.SUCCESS(
+            f'Постов: {created["post"]}, комментариев: {created["comment"]}, '
+            f'подписок: {created["follow"]}, пропущено строк: '
+            f'{len(importer.errors)}. {rows} строк за {elapsed:.1f} с, '
+            f'{rows / elapsed if elapsed else 0:.0f} строк/с'))
@@ -0,0 +1,57 @@
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.models import Post
+from posts.thumbnails import generate, worker_pool
+
+
+def _safe_generate(name):
+    try:
+        generate(name)
+    except Exception as error:
+        return name, str(error)
+    return name, None
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие миниатюры для картинок постов на всех ядрах'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='число процессов, по умолчанию по числу ядер')
+        parser.add_argument('--chunk-size', type=int, default=16)
+
+    def handle(self, *args, **options):
+        if min(options['workers'], options['chunk_size']) < 1:
+            raise CommandError('--workers и --chunk-size от 1')
+        names = (
+            Post.objects.exclude(image='').order_by()
+            .values_list('image', flat=True).distinct().iterator()
+        )
+        started = time.monotonic()
+        done = failed = 0
+        # map() сразу ставит в очередь все задачи: на миллионе картинок
+        # это миллион имён в памяти. Отдаём пулу пачки, которых хватает
+        # на пару кругов всем процессам
+        batch_size = options['workers'] * options['chunk_size'] * 2
+        with worker_pool(options['workers']) as pool:
+            while True:
+                batch = list(islice(names, batch_size))
+                if not batch:
+                    break
+                results = pool.map(
+                    _safe_generate, batch, chunksize=options['chunk_size'])
+                for name, error in results:
+                    if error:
+                        failed += 1
+                        self.stderr.write(f'{name}: {error}')
+                    else:
+                        done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово картинок: {done}, ошибок: {failed}, '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
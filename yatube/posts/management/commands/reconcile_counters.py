@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Сверяет денормализованные счётчики с данными и чинит расхождения'
+
+    def handle(self, *args, **options):
+        drift = counters.reconcile()
+        for table, rows in drift.items():
+            self.stdout.write(f'{table}: исправлено строк {rows}')
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены'))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import caching, media, pages
+from posts.models import Post
+from posts.storage import is_hashed
+
+
+class Command(BaseCommand):
+    help = 'Переносит картинки постов в хешированное хранилище пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=200)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='только посчитать файлы со старыми путями')
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        moved = posts = 0
+        last = ''
+        while True:
+            # keyset по имени файла: перенесённые пути из выборки выпадают
+            names = list(
+                Post.objects.exclude(image='').filter(image__gt=last)
+                .order_by('image').values_list('image', flat=True)
+                .distinct()[:options['batch']]
+            )
+            if not names:
+                break
+            last = names[-1]
+            author_ids, group_ids = set(), set()
+            for name in names:
+                if is_hashed(name) or not storage.exists(name):
+                    continue
+                if options['dry_run']:
+                    moved += 1
+                    continue
+                with storage.open(name) as content:
+                    new_name = storage.save(name, content)
+                with transaction.atomic():
+                    for author_id, group_id in Post.objects.filter(
+                            image=name).values_list('author_id', 'group_id'):
+                        author_ids.add(author_id)
+                        group_ids.add(group_id)
+                    count = Post.objects.filter(image=name).update(
+                        image=new_name)
+                    media.retain(new_name, count)
+                    media.release(name, count)
+                media.delete(name)
+                moved += 1
+                posts += count
+            if not options['dry_run']:
+                caching.bump_generation(Post._meta.db_table)
+                # закэшированные страницы ссылаются на удалённые миниатюры
+                pages.bulk_changed(author_ids, group_ids)
+            self.stdout.write(f'… {moved} файлов, до {last}')
+        if options['dry_run']:
+            self.stdout.write(f'К переносу файлов: {moved}')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено файлов: {moved}, обновлено постов: {posts}'))
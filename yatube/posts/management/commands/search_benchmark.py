@@ -0,0 +1,123 @@
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+SYLLABLES = ['ка', 'ро', 'ми', 'ну', 'ле', 'то', 'са', 'ви', 'до', 'ре']
+# запросы на частое, среднее и редкое слово по рангу в словаре
+RANKS = {'частое': 0, 'среднее': 100, 'редкое': 3000}
+LIKE_SQL = (
+    "SELECT id FROM posts_post WHERE text LIKE ? ESCAPE '\\' "
+    'ORDER BY id DESC LIMIT ?'
+)
+LIKE_COUNT_SQL = (
+    "SELECT count(*) FROM posts_post WHERE text LIKE ? ESCAPE '\\'")
+
+
+def _qmark(sql):
+    return sql.replace('%s', '?')
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает поиск FTS5 и LIKE на синтетической таблице постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10 ** 6)
+        parser.add_argument('--words', type=int, default=5000)
+        parser.add_argument('--length', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--limit', type=int, default=10)
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'search.sqlite3')
+        try:
+            connection = sqlite3.connect(path)
+            vocabulary = self._vocabulary(options['words'])
+            self._fill(connection, vocabulary, options)
+            for label, rank in RANKS.items():
+                word = vocabulary[min(rank, len(vocabulary) - 1)]
+                self._compare(connection, f'{label} «{word}»', word, options)
+            connection.close()
+        finally:
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
+
+    @staticmethod
+    def _vocabulary(size):
+        words = (
+            ''.join(parts)
+            for length in itertools.count(2)
+            for parts in itertools.product(SYLLABLES, repeat=length)
+        )
+        return list(itertools.islice(words, size))
+
+    def _fill(self, connection, vocabulary, options):
+        rows, length = options['rows'], options['length']
+        # распределение Ципфа: как в живом тексте, немногие слова частые
+        weights = list(itertools.accumulate(
+            1 / rank for rank in range(1, len(vocabulary) + 1)))
+        generator = random.Random(0)
+        connection.execute(
+            'CREATE TABLE posts_post (id INTEGER PRIMARY KEY, text TEXT)')
+        started = time.perf_counter()
+        for offset in range(0, rows, 10000):
+            count = min(10000, rows - offset)
+            words = generator.choices(
+                vocabulary, cum_weights=weights, k=count * length)
+            connection.executemany(
+                'INSERT INTO posts_post (id, text) VALUES (?, ?)',
+                ((offset + number + 1,
+                  ' '.join(words[number * length:(number + 1) * length]))
+                 for number in range(count)),
+            )
+        connection.commit()
+        filled = time.perf_counter()
+        for sql in search.CREATE_SQL:
+            connection.execute(sql)
+        connection.commit()
+        indexed = time.perf_counter()
+        self.stdout.write(
+            f'{rows} постов: вставка {filled - started:.1f} с, '
+            f'индекс FTS5 {indexed - filled:.1f} с')
+
+    def _compare(self, connection, label, word, options):
+        repeat, limit = options['repeat'], options['limit']
+        like = f'%{word}%'
+        expression = search.match_expression(word)
+        timings = {
+            'LIKE': self._measure(repeat, lambda: (
+                connection.execute(LIKE_SQL, (like, limit)).fetchall(),
+                connection.execute(LIKE_COUNT_SQL, (like,)).fetchone(),
+            )),
+            'FTS5': self._measure(repeat, lambda: (
+                connection.execute(
+                    _qmark(search.RANKED_SQL), (expression, limit, 0),
+                ).fetchall(),
+                connection.execute(
+                    _qmark(search.COUNT_SQL), (expression,)).fetchone(),
+            )),
+        }
+        found = connection.execute(
+            _qmark(search.COUNT_SQL), (expression,)).fetchone()[0]
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{label}: найдено {found}'))
+        for name, milliseconds in timings.items():
+            self.stdout.write(f'  {name:<5} {milliseconds:9.2f} мс')
+
+    @staticmethod
+    def _measure(repeat, run):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
@@ -0,0 +1,180 @@
+import io
+import random
+import time
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from posts.bulk import (
+    Importer, deferred_indexes, historical_dates, historical_fields)
+from posts.models import Group, Post
+
+WORDS = (
+    'ракета', 'запуск', 'марс', 'луна', 'орбита', 'двигатель', 'тоннель',
+    'машина', 'батарея', 'солнце', 'спутник', 'станция', 'посадка',
+    'баржа', 'топливо', 'метан', 'кислород', 'экипаж', 'капсула',
+    'испытание', 'прототип', 'завод', 'конвейер', 'робот', 'нейросеть',
+    'мем', 'кот', 'кофе', 'утро', 'пятница', 'новость', 'вопрос',
+)
+
+
+def skewed(count, rng, alpha):
+    """Индекс 0..count-1 со степенным перекосом к нулю.
+
+    Чем больше alpha, тем сильнее: при 3 на первый процент индексов
+    приходится около пятой части выборок. Без массивов весов —
+    годится и для миллионов записей.
+    """
+    return min(int(count * rng.random() ** alpha), count - 1)
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу правдоподобными данными с перекосами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument(
+            '--images', type=int, default=10,
+            help='разных картинок на все посты')
+        parser.add_argument('--image-ratio', type=float, default=0.2)
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='за сколько дней до сегодня раскидать посты')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--defer-indexes', action='store_true')
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['groups'],
+               options['batch_size']) < 1:
+            raise CommandError('--users, --groups и --batch-size от 1')
+        if options['users'] < 2 and options['follows']:
+            raise CommandError('Для подписок нужно хотя бы 2 пользователя')
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        started = time.perf_counter()
+        self.slugs = self._groups()
+        self.images = self._images()
+        self.first_id = (Post.objects.aggregate(last=Max('pk'))['last']
+                         or 0) + 1
+        self.now = timezone.now()
+        self.step = (
+            timedelta(days=options['days']) / max(options['posts'], 1))
+        importer = Importer(create_users=True)
+        rows = 0
+        try:
+            with deferred_indexes(options['defer_indexes'], self.stdout), \
+                    historical_dates(*historical_fields()):
+                for batch in self._batches(self._rows()):
+                    importer.write(batch)
+                    rows += len(batch)
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f'… {rows} строк, {rows / elapsed:.0f} строк/с')
+        finally:
+            # как и import_posts: закоммиченные пачки учитываются всегда
+            importer.finish()
+        elapsed = time.perf_counter() - started
+        for number, message in importer.errors[:5]:
+            self.stderr.write(f'строка {number}: {message}')
+        created = importer.created
+        self.stdout.write(self.style.SUCCESS(
+            f'Постов: {created["post"]}, комментариев: {created["comment"]}, '
+            f'подписок: {created["follow"]} за {elapsed:.1f} с, '
+            f'{rows / elapsed if elapsed else 0:.0f} строк/с'))
+
+    def _groups(self):
+        prefix = self.options['prefix']
+        slugs = [
+            f'{prefix}-group-{number}'
+            for number in range(self.options['groups'])]
+        Group.objects.bulk_create(
+            (Group(title=f'Группа {number}', slug=slug,
+                   description='Сгенерирована manage.py seed')
+             for number, slug in enumerate(slugs)),
+            ignore_conflicts=True,
+        )
+        return slugs
+
+    def _images(self):
+        """Картинки из пула: одинаковые файлы хранилище сохранит один раз."""
+        storage = Post._meta.get_field('image').storage
+        names = []
+        for number in range(self.options['images']):
+            image = Image.new('RGB', (1200, 800), tuple(
+                self.rng.randrange(256) for _ in range(3)))
+            ImageDraw.Draw(image).ellipse(
+                (200 + number * 20, 150, 900, 700), fill=(255, 255, 255))
+            content = io.BytesIO()
+            image.save(content, 'JPEG', quality=85)
+            names.append(storage.save(
+                'posts/seed.jpg', ContentFile(content.getvalue())))
+        return names
+
+    def _username(self, index):
+        return f'{self.options["prefix"]}{index}'
+
+    def _pub_date(self, index):
+        # id растут вместе с датой, как у постов, набранных вживую
+        return self.now - (self.options['posts'] - index) * self.step
+
+    def _rows(self):
+        rng, options = self.rng, self.options
+        users, posts = options['users'], options['posts']
+        for index in range(posts):
+            row = {
+                'type': 'post',
+                'id': self.first_id + index,
+                # у немногих авторов большая часть постов
+                'author': self._username(skewed(users, rng, 3)),
+                'group': (
+                    self.slugs[skewed(len(self.slugs), rng, 2)]
+                    if rng.random() < 0.7 else None),
+                'text': ' '.join(rng.choices(WORDS, k=rng.randint(3, 15))),
+                'pub_date': self._pub_date(index).isoformat(),
+            }
+            if self.images and rng.random() < options['image_ratio']:
+                row['image'] = rng.choice(self.images)
+            yield row
+        for _ in range(options['comments'] if posts else 0):
+            # горячие — свежие посты
+            index = posts - 1 - skewed(posts, rng, 4)
+            published = self._pub_date(index)
+            yield {
+                'type': 'comment',
+                'post': self.first_id + index,
+                'author': self._username(rng.randrange(users)),
+                'text': ' '.join(rng.choices(WORDS, k=rng.randint(1, 8))),
+                'created': (
+                    published + (self.now - published) * rng.random()
+                ).isoformat(),
+            }
+        for _ in range(options['follows']):
+            # степенной закон: на первых авторов подписана большая часть
+            author = skewed(users, rng, 4)
+            user = rng.randrange(users)
+            if user != author:
+                yield {
+                    'type': 'follow',
+                    'user': self._username(user),
+                    'author': self._username(author),
+                }
+
+    def _batches(self, rows):
+        batch = []
+        for number, row in enumerate(rows, 1):
+            batch.append((number, row))
+            if len(batch) >= self.options['batch_size']:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
@@ -0,0 +1,50 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import StoredImage
+from .storage import is_hashed
+
+
+def retain(name, count=1):
+    if not name:
+        return
+    with transaction.atomic():
+        if StoredImage.objects.filter(name=name).update(
+                ref_count=F('ref_count') + count):
+            return
+        try:
+            with transaction.atomic():
+                StoredImage.objects.create(name=name, ref_count=count)
+        except IntegrityError:
+            StoredImage.objects.filter(name=name).update(
+                ref_count=F('ref_count') + count)
+
+
+def release(name, count=1):
+    """Снимает ссылки; файл без ссылок удаляется после коммита.
+
+    Перед удалением ссылки проверяются ещё раз: пока транзакция
+    шла, тот же файл мог загрузить кто-то другой. Файлы со старыми
+    путями не удаляются — их переносит rehash_images.
+    """
+    if not name:
+        return
+    StoredImage.objects.filter(name=name, ref_count__gte=count).update(
+        ref_count=F('ref_count') - count)
+    deleted, _ = StoredImage.objects.filter(name=name, ref_count=0).delete()
+    if deleted and is_hashed(name):
+        transaction.on_commit(lambda: _delete_unreferenced(name))
+
+
+def delete(name):
+    """Удаляет файл вместе с его миниатюрами и записями sorl."""
+    from sorl.thumbnail import default
+
+    from .thumbnails import source
+
+    default.backend.delete(source(name))
+
+
+def _delete_unreferenced(name):
+    if not StoredImage.objects.filter(name=name).exists():
+        delete(name)
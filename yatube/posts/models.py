@@ -1,10 +1,31 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import HashedStorage
+
 User = get_user_model()
 
 
-class Post(models.Model):
+class CounterFieldsMixin:
+    """save() существующей записи не перезаписывает счётчики.
+
+    Счётчики меняются только атомарным UPDATE с F() в posts.counters,
+    иначе правка поста затёрла бы параллельно добавленные комментарии.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class Post(CounterFieldsMixin, models.Model):
     text = models.TextField(
         max_length=200,
         help_text='200 символов max',
@@ -34,20 +55,45 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=HashedStorage(),
         blank=True
     )
+    comment_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Комментариев',
+    )
+
+    counter_fields = ('comment_count',)
+    # прежние значения нужны сигналам счётчиков и картинок
+    tracked_fields = ('group_id', 'image')
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=('author', '-pub_date'), name='post_author_date_idx'),
+            models.Index(
+                fields=('group', '-pub_date'), name='post_group_date_idx'),
+        ]
         default_related_name = 'posts'
         verbose_name = 'posts'
         verbose_name_plural = 'посты'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded = {
+            name: value for name, value in zip(field_names, values)
+            if name in cls.tracked_fields
+        }
+        return instance
+
     def __str__(self) -> str:
         return self.text[:15]
 
 
-class Group(models.Model):
+class Group(CounterFieldsMixin, models.Model):
     title = models.CharField(
         max_length=200,
         help_text='200 символов max',
@@ -63,6 +109,20 @@ class Group(models.Model):
         help_text='Опишите группу',
         verbose_name='Описание',
     )
+    post_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Постов',
+    )
+
+    counter_fields = ('post_count',)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # прежний slug нужен, чтобы сбросить страницу по старому адресу
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_slug = dict(zip(field_names, values)).get('slug')
+        return instance
 
     def __str__(self) -> str:
         return self.title
@@ -87,6 +147,12 @@ class Comment(models.Model):
         verbose_name='Дата публикации'
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=('post', 'created'), name='comment_post_created_idx'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -104,3 +170,50 @@ class Follow(models.Model):
 
     def __str__(self) -> str:
         return f'{self.user} подписан на {self.author}'
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя, см. posts.counters."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    post_count = models.PositiveIntegerField(default=0)
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'Счётчики {self.user}'
+
+
+class Timeline(models.Model):
+    """Материализованная лента подписок: строка на пару (читатель, пост)."""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='timeline',
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date'), name='timeline_user_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'), name='unique_timeline_post'),
+        ]
+
+
+class StoredImage(models.Model):
+    """Число постов, ссылающихся на файл в HashedStorage."""
+    name = models.CharField(max_length=255, primary_key=True)
+    ref_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'{self.name} ({self.ref_count})'
@@ -0,0 +1,106 @@
+from django.urls import NoReverseMatch, reverse
+
+from core.page_cache import purge
+
+from .models import Comment, Group, Post, User
+
+
+AUTHOR_TAG = 'author:{}'
+GROUP_TAG = 'group:{}'
+
+
+def post_tags(post):
+    """Теги страницы поста: на ней число постов автора и название группы."""
+    tags = [AUTHOR_TAG.format(post.author_id)]
+    if post.group_id is not None:
+        tags.append(GROUP_TAG.format(post.group_id))
+    return tags
+
+
+def _paths(view_name, values):
+    # объекты с «неправильными» slug/username на сайте не открыть,
+    # значит и сбрасывать для них нечего
+    paths = []
+    for value in values:
+        try:
+            paths.append(reverse(view_name, args=(value,)))
+        except NoReverseMatch:
+            pass
+    return paths
+
+
+def _usernames(*user_ids):
+    return User.objects.filter(pk__in=user_ids).values_list(
+        'username', flat=True)
+
+
+def _group_paths(*group_ids):
+    slugs = Group.objects.filter(
+        pk__in=[pk for pk in group_ids if pk is not None]
+    ).values_list('slug', flat=True)
+    return _paths('posts:group_posts', slugs)
+
+
+def _profile_paths(*user_ids):
+    return _paths('posts:profile', _usernames(*user_ids))
+
+
+def post_changed(post, *old_group_ids):
+    """Главная, профиль автора, страница поста и группы — старая и новая.
+
+    Число постов автора есть на каждой странице его постов — их
+    сбрасывает тег автора.
+    """
+    purge(
+        AUTHOR_TAG.format(post.author_id),
+        reverse('posts:index'),
+        reverse('posts:post_detail', args=(post.pk,)),
+        *_profile_paths(post.author_id),
+        *_group_paths(post.group_id, *old_group_ids),
+    )
+
+
+def comment_changed(comment):
+    purge(reverse('posts:post_detail', args=(comment.post_id,)))
+
+
+def bulk_changed(author_ids, group_ids):
+    """После массовой загрузки: главная, профили авторов и их группы,
+    страницы постов этих авторов."""
+    purge(
+        *(AUTHOR_TAG.format(author_id) for author_id in author_ids),
+        reverse('posts:index'),
+        *_profile_paths(*author_ids),
+        *_group_paths(*group_ids),
+    )
+
+
+def group_changed(group):
+    """Название группы есть в карточках на главной, в профилях и на
+    страницах постов; страница группы сбрасывается и по старому slug."""
+    author_ids = Post.objects.filter(group=group).order_by().values_list(
+        'author_id', flat=True).distinct()
+    slugs = {group.slug, getattr(group, '_loaded_slug', None) or group.slug}
+    purge(
+        GROUP_TAG.format(group.pk),
+        reverse('posts:index'),
+        *_paths('posts:group_posts', slugs),
+        *_profile_paths(*author_ids),
+    )
+
+
+def follow_changed(follow):
+    purge(*_profile_paths(follow.user_id, follow.author_id))
+
+
+def author_changed(user, old_username):
+    """Имя автора — в карточках, на страницах постов и у комментариев."""
+    posts = Post.objects.filter(author=user).order_by()
+    post_ids = set(posts.values_list('pk', flat=True)) | set(
+        Comment.objects.filter(author=user).values_list('post_id', flat=True))
+    purge(
+        reverse('posts:index'),
+        *_paths('posts:profile', [old_username, user.username]),
+        *_group_paths(*posts.values_list('group_id', flat=True).distinct()),
+        *(reverse('posts:post_detail', args=(pk,)) for pk in post_ids),
+    )
@@ -0,0 +1,263 @@
+import base64
+import binascii
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .caching import generations
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def make_cursor(direction, value, pk):
+    raw = f'{direction}|{value.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def encode_cursor(direction, post, field='pub_date'):
+    return make_cursor(direction, getattr(post, field), post.pk)
+
+
+def decode_cursor(cursor):
+    """Возвращает (направление, pub_date, id) или None для битого курсора."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or pub_date is None:
+        return None
+    return direction, pub_date, pk
+
+
+def keyset(queryset, key, field='pub_date', descending=True,
+           pk_field='pk'):
+    """queryset в порядке ключа (field, pk_field), начиная после key.
+
+    descending — от новых к старым, иначе от старых к новым;
+    key=None — с самого начала.
+    """
+    if descending:
+        queryset = queryset.order_by(f'-{field}', f'-{pk_field}')
+        after, pk_after = f'{field}__lt', f'{pk_field}__lt'
+    else:
+        queryset = queryset.order_by(field, pk_field)
+        after, pk_after = f'{field}__gt', f'{pk_field}__gt'
+    if key is None:
+        return queryset
+    value, pk = key
+    return queryset.filter(
+        Q(**{after: value}) | Q(**{field: value, pk_after: pk}))
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по ключу (pub_date, id).
+
+    Не делает COUNT(*) и OFFSET: каждая страница — это диапазонный
+    запрос по индексу от последней записи предыдущей страницы,
+    поэтому глубина страницы не влияет на время выборки.
+    """
+
+    cursor_based = True
+    # поле id в ключе; у строк, которые не сами посты, — id поста,
+    # чтобы курсор не зависел от того, чем выбрана лента
+    pk_field = 'pk'
+
+    def get_page(self, cursor):
+        per_page = self.per_page
+        decoded = decode_cursor(cursor)
+        if decoded is None:
+            direction, key = NEXT, None
+        else:
+            direction, key = decoded[0], decoded[1:]
+        if direction == NEXT:
+            rows = self.older_than(key, per_page + 1)
+            has_previous, has_next = key is not None, len(rows) > per_page
+            rows = rows[:per_page]
+        else:
+            rows = self.newer_than(key, per_page + 1)
+            has_previous, has_next = len(rows) > per_page, True
+            rows = rows[:per_page][::-1]
+        if not rows and key is not None:
+            return self.get_page(None)
+        page = Page(rows, 1, self)
+        page.next_cursor = (
+            self._cursor(NEXT, rows[-1]) if has_next and rows else None
+        )
+        page.previous_cursor = (
+            self._cursor(PREVIOUS, rows[0]) if has_previous and rows
+            else None
+        )
+        return page
+
+    def _cursor(self, direction, row):
+        return make_cursor(
+            direction, row.pub_date, getattr(row, self.pk_field))
+
+    page = get_page
+
+    def older_than(self, key, limit):
+        """Записи старше ключа (pub_date, id), от новых к старым."""
+        return list(keyset(
+            self.object_list, key, pk_field=self.pk_field)[:limit])
+
+    def newer_than(self, key, limit):
+        """Записи новее ключа (pub_date, id), от старых к новым."""
+        return list(keyset(
+            self.object_list, key, descending=False,
+            pk_field=self.pk_field)[:limit])
+
+
+class CachedCountPaginator(Paginator):
+    """Нумерованные страницы с кэшированным COUNT(*).
+
+    Число записей кэшируется по подписи запроса; в ключ входят
+    поколения всех таблиц запроса, так что любая запись в них
+    делает старое значение недостижимым. При count_limit подсчёт
+    останавливается на этой границе и помечается count_is_capped.
+    """
+
+    cursor_based = False
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, count_limit=None,
+                 count_timeout=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_limit = count_limit
+        self.count_timeout = count_timeout
+        self.count_is_capped = False
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+        key = self._count_key()
+        cached = cache.get(key)
+        if cached is None:
+            cached = self._fetch_count()
+            cache.set(key, cached, self.count_timeout)
+        total, self.count_is_capped = cached
+        return total
+
+    def _count_key(self):
+        query = self.object_list.query
+        sql, params = query.sql_with_params()
+        tables = sorted({
+            alias.table_name for alias in query.alias_map.values()
+        })
+        signature = repr((sql, params, self.count_limit, tables,
+                          generations(*tables)))
+        return 'posts:count:' + hashlib.md5(signature.encode()).hexdigest()
+
+    def _fetch_count(self):
+        queryset = self.object_list.order_by()
+        if self.count_limit is None:
+            return queryset.count(), False
+        total = queryset[:self.count_limit + 1].count()
+        if total > self.count_limit:
+            return self.count_limit, True
+        return total, False
+
+    def get_elided_page_range(self, number=1, on_each_side=2, on_ends=1):
+        """Окно номеров вокруг текущей страницы, с многоточиями."""
+        number = self.validate_number(number)
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > 1 + on_each_side + on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < self.num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(
+                self.num_pages - on_ends + 1, self.num_pages + 1)
+        else:
+            yield from range(number + 1, self.num_pages + 1)
+
+    def _get_page(self, *args, **kwargs):
+        page = super()._get_page(*args, **kwargs)
+        page.elided_range = list(self.get_elided_page_range(page.number))
+        return page
+
+
+def estimated_rows(model, using='default'):
+    """Число строк таблицы по статистике планировщика или None.
+
+    SQLite хранит его в sqlite_stat1 после ANALYZE, PostgreSQL —
+    в pg_class.reltuples после VACUUM/ANALYZE.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'sqlite':
+        sql, params = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table]
+    elif connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+        params = [table]
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+    except DatabaseError:
+        return None
+    estimates = [int(str(row[0]).split()[0]) for row in rows if row[0]]
+    return max(estimates) if estimates else None
+
+
+class EstimatedCountPaginator(CachedCountPaginator):
+    """Пагинатор списков админки для больших таблиц.
+
+    Без фильтров и поиска число записей — оценка из статистики
+    базы, если она больше ADMIN_COUNT_LIMIT: точный COUNT(*)
+    по миллионам строк ради номера последней страницы не нужен.
+    Иначе — кэшированный COUNT(*) с той же границей. Сигнатура
+    конструктора — как у Paginator, её ждёт ModelAdmin.get_paginator.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True):
+        super().__init__(
+            object_list, per_page,
+            count_limit=settings.ADMIN_COUNT_LIMIT,
+            count_timeout=settings.PAGINATOR_COUNT_TIMEOUT,
+            orphans=orphans, allow_empty_first_page=allow_empty_first_page,
+        )
+
+    def _fetch_count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.count_limit:
+                return estimate, True
+        return super()._fetch_count()
+
+
+def paginate(request, queryset, per_page=None,
+             cursor_paginator=CursorPaginator):
+    per_page = per_page or settings.PAGINATOR_PER_PAGE
+    if settings.FEED_PAGINATION == 'numbered':
+        paginator = CachedCountPaginator(
+            queryset, per_page,
+            count_limit=settings.PAGINATOR_COUNT_LIMIT,
+            count_timeout=settings.PAGINATOR_COUNT_TIMEOUT,
+        )
+        return paginator.get_page(request.GET.get('page'))
+    paginator = cursor_paginator(queryset, per_page)
+    return paginator.get_page(request.GET.get('cursor'))
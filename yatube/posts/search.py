@@ -0,0 +1,134 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+TABLE = 'posts_post_fts'
+
+# внешний контент: в индексе только токены, текст берётся из posts_post.
+# Триггеры, а не сигналы: индекс не отстаёт и от update()/bulk_create
+# и от правок мимо Django. Но SQLite молча удаляет их вместе с таблицей,
+# а миграции Django меняют поля на SQLite, пересоздавая posts_post:
+# после такой миграции триггеры надо создать заново (missing_triggers()
+# их покажет, SearchTest сверяет схему с CREATE_SQL). Миграция 0012
+# держит свою замороженную копию этого SQL; менять индекс — новой
+# миграцией
+CREATE_SQL = [
+    f"""CREATE VIRTUAL TABLE {TABLE} USING fts5(
+        text, content='posts_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER {TABLE}_ai AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+    f"""CREATE TRIGGER {TABLE}_ad AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END""",
+    f"""CREATE TRIGGER {TABLE}_au AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+    f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')",
+]
+TRIGGERS = [f'{TABLE}_{suffix}' for suffix in ('ai', 'ad', 'au')]
+DROP_SQL = [
+    f'DROP TRIGGER IF EXISTS {trigger}' for trigger in TRIGGERS
+] + [f'DROP TABLE IF EXISTS {TABLE}']
+
+MATCH_SQL = f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s'
+RANKED_SQL = MATCH_SQL + ' ORDER BY rank LIMIT %s OFFSET %s'
+COUNT_SQL = f'SELECT count(*) FROM {TABLE} WHERE {TABLE} MATCH %s'
+
+WORD = re.compile(r'\w+')
+
+
+def available(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def schema(using=connection):
+    """{имя: CREATE ...} таблицы индекса и триггеров, как они в базе."""
+    with using.cursor() as cursor:
+        cursor.execute(
+            'SELECT name, sql FROM sqlite_master WHERE name IN '
+            f'({", ".join(["%s"] * (len(TRIGGERS) + 1))})',
+            [TABLE, *TRIGGERS])
+        return dict(cursor.fetchall())
+
+
+def missing_triggers(using=connection):
+    """Триггеры индекса, которых нет в базе: индекс перестал обновляться."""
+    found = schema(using)
+    return [trigger for trigger in TRIGGERS if trigger not in found]
+
+
+def match_expression(text):
+    """Строка поиска пользователя → выражение MATCH.
+
+    Каждое слово берётся в кавычки, чтобы AND, NEAR, «-» и прочий
+    синтаксис FTS5 из ввода не ломал запрос; последнее слово ищется
+    по префиксу. Пустая строка, если слов нет.
+    """
+    words = WORD.findall(text.lower())
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def matching_ids(text):
+    """Подзапрос id подходящих постов, для filter(pk__in=...)."""
+    return RawSQL(MATCH_SQL, [match_expression(text)])
+
+
+class SearchResults:
+    """Посты по запросу, от самых релевантных (bm25).
+
+    Похоже на queryset ровно настолько, насколько нужно Paginator:
+    count() и срез. Срез — один запрос к индексу за id страницы
+    и один за сами посты; текст постов индекс не читает.
+    """
+
+    def __init__(self, text, queryset=None):
+        self.expression = match_expression(text)
+        self.queryset = queryset if queryset is not None else (
+            Post.objects.select_related('author', 'group'))
+
+    def count(self):
+        if not self.expression:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(COUNT_SQL, [self.expression])
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        if not self.expression or stop is not None and stop <= start:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(RANKED_SQL, [
+                self.expression, -1 if stop is None else stop - start, start,
+            ])
+            ids = [row[0] for row in cursor.fetchall()]
+        posts = self.queryset.in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def search(text):
+    """Результаты поиска: FTS5 на SQLite, иначе LIKE по тексту."""
+    if available():
+        return SearchResults(text)
+    if not WORD.search(text):
+        return Post.objects.none()
+    return Post.objects.select_related('author', 'group').filter(
+        text__icontains=text.strip())
@@ -0,0 +1,133 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching, counters, feeds, media, pages, thumbnails, timeline
+from .models import Comment, Follow, Group, Post, User
+
+# поля пользователя, которые выводятся в карточках и комментариях
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name')
+
+
+# подписка на конкретные модели, а не на все сразу: слушатель без
+# sender отключил бы быстрое удаление у остальных моделей
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Follow)
+def table_changed(sender, **kwargs):
+    caching.bump_generation(sender._meta.db_table)
+
+
+@receiver(pre_save, sender=Post)
+def post_before_save(sender, instance, **kwargs):
+    """Запоминает прежние группу и картинку для post_created.
+
+    Если они не менялись с загрузки из базы, хватает загруженных
+    значений; перечитываются только изменённые, чтобы не опираться
+    на устаревшую копию.
+    """
+    saved = None
+    if not instance._state.adding:
+        current = (instance.group_id, instance.image.name)
+        loaded = getattr(instance, '_loaded', {})
+        if tuple(loaded.get(name) for name in Post.tracked_fields) == current:
+            saved = current
+        else:
+            saved = Post.objects.filter(
+                pk=instance.pk).values_list(*Post.tracked_fields).first()
+    instance._saved_group_id, instance._saved_image = saved or (None, '')
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, post_count=1)
+        counters.bump_group(instance.group_id, 1)
+        feeds.forget_author(instance.author_id)
+        if feeds.uses_timeline():
+            timeline.fan_out(instance)
+    elif instance._saved_group_id != instance.group_id:
+        counters.bump_group(instance._saved_group_id, -1)
+        counters.bump_group(instance.group_id, 1)
+    if instance.image.name != instance._saved_image:
+        media.retain(instance.image.name)
+        media.release(instance._saved_image)
+        thumbnails.pregenerate(instance.image.name)
+    pages.post_changed(instance, instance._saved_group_id)
+    instance._loaded = {
+        'group_id': instance.group_id, 'image': instance.image.name}
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, post_count=-1)
+    counters.bump_group(instance.group_id, -1)
+    feeds.forget_author(instance.author_id)
+    media.release(instance.image.name)
+    pages.post_changed(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_post(instance.post_id, 1)
+    pages.comment_changed(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_post(instance.post_id, -1)
+    pages.comment_changed(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, follower_count=1)
+        counters.bump_user(instance.user_id, following_count=1)
+        if feeds.uses_timeline():
+            timeline.backfill(instance.user_id, instance.author_id)
+        pages.follow_changed(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, follower_count=-1)
+    counters.bump_user(instance.user_id, following_count=-1)
+    if feeds.uses_timeline():
+        timeline.prune(instance.user_id, instance.author_id)
+    pages.follow_changed(instance)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    pages.group_changed(instance)
+    instance._loaded_slug = instance.slug
+
+
+@receiver(pre_save, sender=User)
+def user_before_save(sender, instance, update_fields=None, **kwargs):
+    # вход обновляет только last_login — ради него базу не читаем
+    instance._saved_names = None
+    if instance._state.adding or (
+            update_fields is not None
+            and not set(update_fields) & set(AUTHOR_FIELDS)):
+        return
+    instance._saved_names = User.objects.filter(
+        pk=instance.pk).values_list(*AUTHOR_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    """Переименование автора сбрасывает фрагменты лент и страницы."""
+    saved = getattr(instance, '_saved_names', None)
+    if saved is None or saved == tuple(
+            getattr(instance, field) for field in AUTHOR_FIELDS):
+        return
+    caching.bump_generation(User._meta.db_table)
+    pages.author_changed(instance, saved[0])
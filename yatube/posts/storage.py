@@ -0,0 +1,56 @@
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASHED_NAME = re.compile(r'/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+@deconstructible
+class HashedStorage(FileSystemStorage):
+    """Файлы по хешу содержимого: posts/ab/cd/abcd….jpg.
+
+    Два уровня каталогов по 256 штук держат их размер небольшим даже
+    на миллионах файлов, а повторная загрузка того же файла не пишет
+    копию: save() вернёт имя уже лежащего файла. Сколько постов
+    ссылается на файл, считает StoredImage, см. posts.media.
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            os.path.dirname(name), digest[:2], digest[2:4],
+            digest + extension,
+        )
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        saved = super()._save(name, content)
+        if saved != name:
+            # тот же файл параллельно записала другая загрузка, и наш
+            # лёг рядом с суффиксом. Содержимое одинаковое: атомарно
+            # ставим свою полную копию на место хеша, суффикс не остаётся
+            os.replace(self.path(saved), self.path(name))
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # исходное имя всё равно заменится хешем в _save; суффикс нужен
+        # только при гонке двух одинаковых загрузок за один хеш, и
+        # живёт он до конца _save
+        if not is_hashed(name):
+            return name
+        return super().get_available_name(name, max_length)
+
+
+def is_hashed(name):
+    return bool(HASHED_NAME.search(name))
@@ -0,0 +1,60 @@
+import hashlib
+
+from django import template
+
+from ..caching import stale_while_revalidate
+
+register = template.Library()
+
+FRAGMENT_KEY = 'posts:fragment:{}:{}'
+
+
+class SWRCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, name, vary_on, version):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.name = name
+        self.vary_on = vary_on
+        self.version = version
+
+    def render(self, context):
+        timeout = self.timeout.resolve(context)
+        vary_on = [str(var.resolve(context)) for var in self.vary_on]
+        digest = hashlib.md5(':'.join(vary_on).encode()).hexdigest()
+        version = self.version.resolve(context) if self.version else None
+        return stale_while_revalidate(
+            FRAGMENT_KEY.format(self.name, digest),
+            lambda: self.nodelist.render(context),
+            timeout,
+            version=version,
+            name=self.name,
+        )
+
+
+@register.tag
+def swrcache(parser, token):
+    """Как {% cache %}, но устаревший фрагмент отдаётся, пока один
+    запрос его пересобирает.
+
+    {% swrcache timeout name [vary_on ...] [version=...] %}
+
+    version не входит в ключ: смена версии делает запись устаревшей,
+    а не пропавшей, поэтому запись в таблицы не вызывает лавину
+    одновременных пересборок.
+    """
+    nodelist = parser.parse(('endswrcache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' принимает минимум два аргумента.")
+    version = None
+    if bits[-1].startswith('version='):
+        version = parser.compile_filter(bits.pop()[len('version='):])
+    return SWRCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        bits[2],
+        [parser.compile_filter(bit) for bit in bits[3:]],
+        version,
+    )
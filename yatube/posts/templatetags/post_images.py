@@ -0,0 +1,56 @@
+from django import template
+from django.conf import settings
+
+register = template.Library()
+
+MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+    'AVIF': 'image/avif',
+}
+
+
+def _srcset(thumbnails):
+    # у миниатюры пропавшего исходника нет размеров — её не описать
+    widths = {
+        thumbnail.width: thumbnail.url for thumbnail in thumbnails
+        if thumbnail.size
+    }
+    return ', '.join(
+        f'{url} {width}w' for width, url in sorted(widths.items()))
+
+
+@register.inclusion_tag('posts/includes/card_image.html')
+def card_image(post):
+    """<picture> карточки из вариантов, собранных thumbnails.prefetch.
+
+    Современные форматы идут в <source> с srcset по ширинам, формат
+    запасного src — в srcset самого <img>; браузер берёт первый
+    понятный ему формат и ширину по sizes.
+    """
+    by_format = {}
+    for thumbnail, image_format in getattr(post, 'image_variants', ()):
+        by_format.setdefault(image_format, []).append(thumbnail)
+    fallback = getattr(post, 'thumbnail', None)
+    if fallback is None:
+        return {'image': None}
+    fallback_format = post.image_variants[0][1]
+    srcset = _srcset(by_format.pop(fallback_format))
+    sources = []
+    for image_format, thumbnails in by_format.items():
+        # <source> без type браузер примет за любой формат, поэтому
+        # незнакомый формат из настроек просто не предлагаем
+        mime_type = MIME_TYPES.get(image_format)
+        source_srcset = _srcset(thumbnails)
+        if mime_type and source_srcset:
+            sources.append({'type': mime_type, 'srcset': source_srcset})
+    width, height = fallback.size or (None, None)
+    return {
+        'image': fallback,
+        'width': width,
+        'height': height,
+        'srcset': srcset,
+        'sources': sources,
+        'sizes': settings.CARD_IMAGE_SIZES,
+    }
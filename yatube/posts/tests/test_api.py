@@ -0,0 +1,122 @@
+import json
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post
+from posts.paginator import NEXT, PREVIOUS, make_cursor
+
+User = get_user_model()
+
+
+@override_settings(API_PAGE_SIZE=3)
+class FeedApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mask')
+        cls.group = Group.objects.create(
+            title='Тест групп', slug='test-slug', description='Описание')
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {number}', author=cls.author,
+                group=cls.group if number % 2 else None)
+            for number in range(7)
+        ]
+        for number in range(4):
+            Comment.objects.create(
+                post=cls.posts[0], author=cls.author, text=f'Ответ {number}')
+
+    def setUp(self):
+        cache.clear()
+
+    def read(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        if response.streaming:
+            return json.loads(b''.join(response.streaming_content))
+        return json.loads(response.content)
+
+    def read_all(self, url):
+        data = self.read(url)
+        results = data['results']
+        while data['next']:
+            data = self.read(url, cursor=data['next'])
+            results.extend(data['results'])
+        return results
+
+    def test_feeds_walk_by_cursor(self):
+        newest_first = [post.pk for post in reversed(self.posts)]
+        feeds = {
+            reverse('api_v1:posts'): newest_first,
+            reverse('api_v1:group_posts', args=(self.group.slug,)): [
+                pk for pk in newest_first
+                if Post.objects.get(pk=pk).group_id],
+            reverse('api_v1:author_posts', args=(self.author.username,)):
+                newest_first,
+        }
+        for url, expected in feeds.items():
+            with self.subTest(url=url):
+                self.assertEqual(
+                    [post['id'] for post in self.read_all(url)], expected)
+
+    def test_backward_cursor_is_rejected(self):
+        url = reverse('api_v1:posts')
+        post = self.posts[3]
+        response = self.client.get(url, {
+            'cursor': make_cursor(PREVIOUS, post.pub_date, post.pk)})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(
+            [row['id'] for row in self.read(url, cursor=make_cursor(
+                NEXT, post.pub_date, post.pk))['results']],
+            [post.pk for post in reversed(self.posts[:3])])
+
+    def test_post_detail(self):
+        post = self.posts[1]
+        data = self.read(reverse('api_v1:post_detail', args=(post.pk,)))
+        self.assertEqual(data['text'], post.text)
+        self.assertEqual(data['author'], 'Mask')
+        self.assertEqual(data['group'], 'test-slug')
+        self.assertEqual(data['comments'], 0)
+        self.assertIsNone(data['image'])
+
+    def test_comments_oldest_first(self):
+        url = reverse('api_v1:post_comments', args=(self.posts[0].pk,))
+        self.assertEqual(
+            [comment['text'] for comment in self.read_all(url)],
+            [f'Ответ {number}' for number in range(4)])
+
+    def test_page_is_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.read(reverse('api_v1:posts'), limit=50)
+        selects = [
+            query['sql'] for query in queries
+            if 'posts_post' in query['sql'] and 'MAX(' not in query['sql']]
+        self.assertEqual(len(selects), 1)
+        self.assertNotIn('"auth_user"."password"', selects[0])
+
+    def test_unknown_objects_and_writes(self):
+        for url in (
+            reverse('api_v1:post_detail', args=(0,)),
+            reverse('api_v1:post_comments', args=(0,)),
+            reverse('api_v1:group_posts', args=('nope',)),
+            reverse('api_v1:author_posts', args=('nobody',)),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.client.get(url).status_code, HTTPStatus.NOT_FOUND)
+        self.assertEqual(
+            self.client.post(reverse('api_v1:posts')).status_code,
+            HTTPStatus.METHOD_NOT_ALLOWED)
+
+    def test_not_modified(self):
+        url = reverse('api_v1:posts')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            HTTPStatus.NOT_MODIFIED)
@@ -0,0 +1,264 @@
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db.models import Count
+from django.urls import reverse
+
+from posts import export
+from posts.models import Comment, Follow, Group, Post, Timeline
+from posts.search import search
+
+User = get_user_model()
+
+
+class ImportPostsTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Mask')
+        self.group = Group.objects.create(
+            title='Тест групп', slug='test-slug', description='Описание')
+
+    def run_import(self, rows, *args):
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w', encoding='utf-8') as stream:
+            for row in rows:
+                stream.write(
+                    row if isinstance(row, str)
+                    else json.dumps(row, ensure_ascii=False))
+                stream.write('\n')
+        out, err = StringIO(), StringIO()
+        call_command('import_posts', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_rows_are_imported_in_batches(self):
+        rows = [
+            {'type': 'post', 'id': 10 + number, 'author': 'Mask',
+             'group': 'test-slug', 'text': f'Запуск {number}',
+             'pub_date': '2020-05-30T19:22:00+00:00'}
+            for number in range(5)
+        ] + [
+            {'type': 'comment', 'post': 10, 'author': 'reader',
+             'text': 'Ура'},
+            {'type': 'follow', 'user': 'reader', 'author': 'Mask'},
+        ]
+        out, err = self.run_import(
+            rows, '--batch-size', '2', '--create-users')
+        self.assertEqual(err, '')
+        self.assertIn('строк/с', out)
+        self.assertEqual(Post.objects.filter(group=self.group).count(), 5)
+        self.assertEqual(
+            Post.objects.get(pk=10).pub_date.isoformat(),
+            '2020-05-30T19:22:00+00:00')
+        self.assertEqual(Post.objects.get(pk=10).comment_count, 1)
+        self.assertTrue(Follow.objects.filter(
+            user__username='reader', author=self.author).exists())
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.author.stats.post_count, 5)
+        self.assertEqual(search('запуск').count(), 5)
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        Post.objects.create(pk=1, text='Старый', author=self.author)
+        out, err = self.run_import([
+            {'type': 'post', 'id': 1, 'author': 'Mask', 'text': 'Дубль'},
+            {'type': 'post', 'id': 2, 'author': 'nobody', 'text': 'Кто'},
+            {'type': 'post', 'id': 3, 'author': 'Mask', 'text': ''},
+            {'type': 'comment', 'post': 99, 'author': 'Mask', 'text': '?'},
+            'не json',
+            {'type': 'post', 'id': 4, 'author': 'Mask', 'text': 'Хороший'},
+        ])
+        self.assertEqual(len(err.strip().splitlines()), 5)
+        self.assertIn('строка 5: не JSON', err)
+        self.assertEqual(
+            sorted(Post.objects.values_list('pk', flat=True)), [1, 4])
+        self.assertFalse(Comment.objects.exists())
+
+    def test_committed_batches_are_reconciled_on_error(self):
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'wb') as stream:
+            # битый байт за пределами первого прочитанного блока файла
+            stream.write(json.dumps(
+                {'type': 'post', 'id': 5, 'author': 'Mask', 'text': 'Марс'}
+            ).encode() + b'\n' + b' ' * 10000 + b'\n\xff\n')
+        with self.assertRaises(UnicodeDecodeError):
+            call_command(
+                'import_posts', path, '--batch-size', '1',
+                stdout=StringIO(), stderr=StringIO())
+        self.assertTrue(Post.objects.filter(pk=5).exists())
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.author.stats.post_count, 1)
+
+    @override_settings(FOLLOW_TIMELINE_BACKFILL=1)
+    def test_only_touched_feeds_are_updated(self):
+        fan, old = (
+            User.objects.create_user(username=name) for name in ('fan', 'old'))
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=fan, author=self.author)
+        Follow.objects.create(user=old, author=other)
+        # обе записи дошли до ленты при сохранении; пересборка с нуля
+        # оставила бы одну, по FOLLOW_TIMELINE_BACKFILL
+        for number in range(2):
+            Post.objects.create(text=f'Старый {number}', author=other)
+        Group.objects.create(
+            title='Чужая', slug='other', description='', post_count=7)
+        self.run_import([
+            {'type': 'post', 'id': 50, 'author': 'Mask', 'text': 'Новый'},
+            {'type': 'follow', 'user': 'reader', 'author': 'Mask'},
+        ], '--create-users')
+        feeds = {
+            user.username: set(Timeline.objects.filter(
+                user=user).values_list('post_id', flat=True))
+            for user in User.objects.exclude(username__in=('Mask', 'other'))
+        }
+        self.assertEqual(feeds['fan'], {50})
+        self.assertEqual(feeds['reader'], {50})
+        self.assertEqual(len(feeds['old']), 2)
+        self.assertEqual(Group.objects.get(slug='other').post_count, 7)
+
+    def test_deferred_indexes_are_rebuilt(self):
+        out, _ = self.run_import([
+            {'type': 'post', 'id': 7, 'author': 'Mask', 'text': 'Марс'},
+        ], '--defer-indexes')
+        self.assertIn('Индексы построены', out)
+        self.assertEqual([post.pk for post in search('марс')[:10]], [7])
+        post = Post.objects.create(text='Луна', author=self.author)
+        self.assertEqual(
+            [found.pk for found in search('луна')[:10]], [post.pk])
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mask')
+        group = Group.objects.create(
+            title='Тест групп', slug='test-slug', description='Описание')
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост, {number}', author=cls.author, group=group)
+            for number in range(7)
+        ]
+
+    def path(self, suffix):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_jsonl_gzip_matches_import_format(self):
+        path = self.path('.jsonl.gz')
+        call_command(
+            'export', 'posts', '--output', path, '--gzip',
+            '--chunk-size', '3', stdout=StringIO())
+        with gzip.open(path, 'rt', encoding='utf-8') as stream:
+            rows = [json.loads(line) for line in stream]
+        self.assertEqual([row['id'] for row in rows],
+                         sorted(post.pk for post in self.posts))
+        self.assertEqual(rows[0]['type'], 'post')
+        self.assertEqual(rows[0]['author'], 'Mask')
+        self.assertEqual(rows[0]['group'], 'test-slug')
+        self.assertEqual(rows[0]['text'], 'Пост, 0')
+
+    def test_id_ranges_cover_table_once(self):
+        ranges = export.id_ranges(Post, 3)
+        self.assertEqual(len(ranges), 3)
+        ids = []
+        for number, (start, stop) in enumerate(ranges):
+            path = self.path('.csv')
+            export.export_range(
+                'posts', 'csv', path, start, stop, 2, False, number == 0)
+            with open(path, encoding='utf-8') as stream:
+                lines = stream.read().splitlines()
+            if number == 0:
+                self.assertEqual(lines.pop(0), 'id,author,group,text,'
+                                 'pub_date,image')
+            ids.extend(int(line.split(',')[0]) for line in lines)
+        self.assertEqual(ids, sorted(post.pk for post in self.posts))
+
+    def test_admin_action_streams_selection(self):
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        selected = [self.posts[1].pk, self.posts[4].pk]
+        response = self.client.post(
+            reverse('admin:posts_post_changelist'),
+            {'action': 'export_jsonl', '_selected_action': selected})
+        self.assertTrue(response.streaming)
+        rows = [
+            json.loads(line) for line in
+            b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], selected)
+
+
+class SeedAndBenchmarkTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        call_command(
+            'seed', '--users', '20', '--posts', '200', '--comments', '300',
+            '--follows', '100', '--groups', '3', '--images', '1',
+            '--batch-size', '50', stdout=StringIO())
+
+    def test_seed_data_is_skewed(self):
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertTrue(Post.objects.exclude(image='').exists())
+        top, *rest = User.objects.annotate(
+            total=Count('posts')).order_by('-total')
+        self.assertEqual(top.username, 'seed0')
+        self.assertGreater(top.total, 200 / len(rest))
+        self.assertEqual(
+            User.objects.annotate(total=Count('following')).order_by(
+                '-total').first().username,
+            'seed0')
+
+    def test_benchmark_covers_urls_and_compares(self):
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        call_command(
+            'benchmark_views', '--requests', '3', '--warmup', '1',
+            '--output', path, stdout=StringIO())
+        with open(path, encoding='utf-8') as stream:
+            results = json.load(stream)
+        self.assertEqual(set(results['views']), {
+            'index', 'group_list', 'group_posts', 'profile', 'post_detail',
+            'search', 'post_comments', 'post_create', 'post_edit',
+            'follow_index',
+        })
+        index = results['views']['index']
+        self.assertEqual(index['status'], 200)
+        self.assertGreater(index['queries'], 0)
+        self.assertLessEqual(index['p50_ms'], index['p99_ms'])
+        results['views']['index']['queries'] = 0
+        with open(path, 'w', encoding='utf-8') as stream:
+            json.dump(results, stream)
+        with self.assertRaisesMessage(CommandError, 'index'):
+            call_command(
+                'benchmark_views', '--requests', '3', '--compare', path,
+                '--threshold', '1000000', stdout=StringIO())
+
+    def test_cold_benchmark_leaves_project_cache_alone(self):
+        cache.set('benchmark-sentinel', 'тут')
+        out = StringIO()
+        call_command(
+            'benchmark_views', '--requests', '2', '--warmup', '1',
+            '--anonymous', '--cold', stdout=out)
+        self.assertIn('index', out.getvalue())
+        self.assertEqual(cache.get('benchmark-sentinel'), 'тут')
+        memcached = {'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': '127.0.0.1:11211',
+        }}
+        with override_settings(CACHES=memcached):
+            with self.assertRaisesMessage(CommandError, "'default'"):
+                call_command(
+                    'benchmark_views', '--requests', '1', '--cold',
+                    stdout=StringIO())
@@ -1,6 +1,10 @@
+import io
+
+from PIL import Image
 from posts.forms import PostForm
 from posts.models import User, Post, Group, Comment
-from django.test import Client, TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
 
@@ -142,3 +146,63 @@ class TestCommentCreate(TestCase):
         )
 
         self.assertEqual(Comment.objects.count(), counter_hater)
+
+
+class ImageUploadTest(TestCase):
+    @staticmethod
+    def photo(size=(3000, 2000), orientation=None):
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'Телефон'
+        if orientation:
+            exif[0x0112] = orientation
+        Image.new('RGB', size, (200, 40, 40)).save(
+            buffer, 'JPEG', exif=exif.tobytes())
+        return SimpleUploadedFile(
+            'photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def clean_image(self, upload):
+        form = PostForm({'text': 'Текст'}, {'image': upload})
+        form.is_valid()
+        return form
+
+    def test_large_photo_is_downscaled_without_metadata(self):
+        form = self.clean_image(self.photo(orientation=6))
+        self.assertTrue(form.is_valid(), form.errors)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.size, (1067, 1600))
+            self.assertEqual(dict(image.getexif()), {})
+
+    def test_palette_transparency_is_kept(self):
+        buffer = io.BytesIO()
+        image = Image.new('P', (3000, 2000), 1)
+        image.putpalette([255, 255, 255, 200, 40, 40] + [0] * 762)
+        exif = Image.Exif()
+        exif[0x010F] = 'Телефон'
+        image.save(buffer, 'PNG', transparency=1, exif=exif.tobytes())
+        form = self.clean_image(SimpleUploadedFile(
+            'logo.png', buffer.getvalue(), content_type='image/png'))
+        self.assertTrue(form.is_valid(), form.errors)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.size, (1600, 1067))
+            self.assertEqual(image.mode, 'P')
+            self.assertEqual(image.info.get('transparency'), 1)
+            self.assertNotIn('exif', image.info)
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=1000)
+    def test_too_many_pixels(self):
+        form = self.clean_image(self.photo())
+        self.assertIn('мегапикселей', form.errors['image'][0])
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1000)
+    def test_oversized_upload_is_rejected_unopened(self):
+        user = User.objects.create_user(username='pedro')
+        client = Client()
+        client.force_login(user)
+        response = client.post(
+            reverse('posts:post_create'),
+            {'text': 'Текст', 'image': self.photo()},
+        )
+        self.assertIn(
+            'Файл больше', response.context['form'].errors['image'][0])
+        self.assertFalse(Post.objects.exists())
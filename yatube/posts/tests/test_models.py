@@ -1,7 +1,20 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-from ..models import Group, Post
+from .. import counters
+from ..models import Comment, Follow, Group, Post, StoredImage, UserStats
+from ..storage import HashedStorage, is_hashed
 
 User = get_user_model()
 
@@ -44,3 +57,170 @@ class ModelTestgroup(TestCase):
         group = ModelTestgroup.group
         expected_object_name = group.title
         self.assertEqual(expected_object_name, str(group))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются вместе с постами, комментариями и подписками."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group)
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.group.post_count, 1)
+        self.assertEqual(UserStats.objects.get(user=self.user).post_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.user).follower_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1)
+
+        post.text = 'Правка'
+        post.group = None
+        post.save()
+        self.group.refresh_from_db()
+        post.refresh_from_db()
+        self.assertEqual(self.group.post_count, 0)
+        self.assertEqual(post.comment_count, 1)
+
+        follow.delete()
+        post.delete()
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.post_count, stats.follower_count), (0, 0))
+
+    def test_edit_without_group_change_skips_select(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group)
+        post = Post.objects.get(pk=post.pk)
+        post.text = 'Правка'
+        with CaptureQueriesContext(connection) as queries:
+            post.save()
+        self.assertFalse([
+            query for query in queries
+            if query['sql'].startswith('SELECT')
+            and 'posts_post' in query['sql']])
+        post.group = None
+        with CaptureQueriesContext(connection) as queries:
+            post.save()
+        self.assertTrue([
+            query for query in queries
+            if query['sql'].startswith('SELECT')
+            and 'posts_post' in query['sql']])
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 0)
+
+    def test_reconcile_repairs_drift(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group)
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        Post.objects.filter(pk=post.pk).update(comment_count=7)
+        UserStats.objects.filter(user=self.user).delete()
+        drift = counters.reconcile()
+        self.assertEqual(drift, {'users': 1, 'groups': 0, 'posts': 1})
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.user.stats.post_count, 1)
+
+    def test_reconcile_only_given_ids(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group)
+        other = Post.objects.create(author=self.reader, text='Другой')
+        Post.objects.filter(pk__in=(post.pk, other.pk)).update(
+            comment_count=7)
+        Group.objects.filter(pk=self.group.pk).update(post_count=7)
+        drift = counters.reconcile(
+            user_ids=[], group_ids=[], post_ids=[post.pk])
+        self.assertEqual(drift, {'users': 0, 'groups': 0, 'posts': 1})
+        self.assertEqual(
+            dict(Post.objects.values_list('pk', 'comment_count')),
+            {post.pk: 0, other.pk: 7})
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 7)
+
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+class RacingStorage(HashedStorage):
+    """Один раз отвечает, что хеша нет, хотя его уже записали."""
+
+    racing = False
+
+    def exists(self, name):
+        if self.racing and is_hashed(name):
+            self.racing = False
+            return False
+        return super().exists(name)
+
+
+@override_settings(THUMBNAIL_PREGENERATE='')
+class HashedStorageTest(TransactionTestCase):
+    def create_post(self, author, name):
+        return Post.objects.create(
+            text='Пост', author=author,
+            image=SimpleUploadedFile(name, SMALL_GIF, 'image/gif'))
+
+    def test_same_content_is_stored_once(self):
+        author = User.objects.create_user(username='author')
+        first = self.create_post(author, 'first.gif')
+        second = self.create_post(author, 'second.gif')
+        self.assertTrue(is_hashed(first.image.name))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            StoredImage.objects.get(name=first.image.name).ref_count, 2)
+
+        storage = first.image.storage
+        first.delete()
+        self.assertTrue(storage.exists(second.image.name))
+        second.delete()
+        self.assertFalse(storage.exists(second.image.name))
+        self.assertFalse(StoredImage.objects.exists())
+
+    def test_racing_uploads_share_one_file(self):
+        storage = RacingStorage(location=tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, storage.location)
+        first = storage.save('posts/first.gif', ContentFile(SMALL_GIF))
+        storage.racing = True
+        second = storage.save('posts/second.gif', ContentFile(SMALL_GIF))
+        self.assertEqual(second, first)
+        self.assertEqual(
+            os.listdir(os.path.dirname(storage.path(first))),
+            [os.path.basename(first)])
+
+    @override_settings(PAGE_CACHE_TIMEOUT=600)
+    def test_rehash_purges_cached_pages(self):
+        author = User.objects.create_user(username='author')
+        storage = Post._meta.get_field('image').storage
+        os.makedirs(storage.path('posts'), exist_ok=True)
+        with open(storage.path('posts/old.gif'), 'wb') as old:
+            old.write(SMALL_GIF)
+        post = Post.objects.create(
+            text='Пост', author=author, image='posts/old.gif')
+        self.addCleanup(post.delete)
+        url = reverse('posts:profile', args=(author.username,))
+        response = self.client.get(url)
+        thumbnail = response.context['page_obj'][0].thumbnail.url
+        self.assertContains(response, thumbnail)
+        call_command('rehash_images', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(is_hashed(post.image.name))
+        self.assertNotContains(self.client.get(url), thumbnail)
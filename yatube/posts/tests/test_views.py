@@ -1,10 +1,25 @@
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings)
 from django.urls import reverse
 from posts.models import Post, Group, Comment, Follow
 from django import forms
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+from posts.cards import PageCards, card_key
+from posts.feeds import recent_key, recent_post_keys
+from core.page_cache import page_key
+from posts.caching import (
+    LOCK_KEY, METRIC_KEY, flush_metrics, generations,
+    stale_while_revalidate, swr_metrics)
+from posts import search as search_module
+from posts.paginator import CachedCountPaginator, EstimatedCountPaginator
+from posts.templatetags.post_images import card_image
+from posts.thumbnails import generate, prefetch
 
 
 User = get_user_model()
@@ -150,6 +165,7 @@ class PostsPagesTests(TestCase):
                 self.assertIsInstance(form_field, expected)
 
 
+@override_settings(PAGE_CACHE_TIMEOUT=0)
 class PaginatorViewsTest(TestCase):
 
     @classmethod
@@ -192,7 +208,77 @@ class PaginatorViewsTest(TestCase):
         )
         self.assertEqual(len(response.context['page_obj']), 5)
 
+    def test_cursor_pages(self):
+        """Курсоры ведут по страницам без пропусков и повторов."""
+        url = reverse('posts:index')
+        first = self.client.get(url).context['page_obj']
+        self.assertIsNone(first.previous_cursor)
+        second = self.client.get(
+            url, {'cursor': first.next_cursor}).context['page_obj']
+        third = self.client.get(
+            url, {'cursor': second.next_cursor}).context['page_obj']
+        self.assertEqual(len(second), 5)
+        self.assertEqual(len(third), 4)
+        self.assertIsNone(third.next_cursor)
+        seen = [post.pk for page in (first, second, third) for post in page]
+        self.assertEqual(
+            seen, list(Post.objects.values_list('pk', flat=True)))
+        back = self.client.get(
+            url, {'cursor': third.previous_cursor}).context['page_obj']
+        self.assertEqual(list(back), list(second))
+
+    def test_broken_cursor_shows_first_page(self):
+        response = self.client.get(
+            reverse('posts:index'), {'cursor': 'не-курсор'})
+        self.assertEqual(len(response.context['page_obj']), 5)
+        self.assertIsNone(response.context['page_obj'].previous_cursor)
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class CachedCountPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='noname')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=cls.user)
+            for number in range(30)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_count_is_cached_until_write(self):
+        """COUNT(*) берётся из кэша, пока в таблицу никто не пишет."""
+        paginator = CachedCountPaginator(Post.objects.all(), 5)
+        self.assertEqual(paginator.count, 30)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                CachedCountPaginator(Post.objects.all(), 5).count, 30)
+        Post.objects.create(text='Ещё', author=self.user)
+        self.assertEqual(
+            CachedCountPaginator(Post.objects.all(), 5).count, 31)
+
+    def test_count_limit(self):
+        paginator = CachedCountPaginator(
+            Post.objects.all(), 5, count_limit=20)
+        self.assertEqual(paginator.num_pages, 4)
+        self.assertTrue(paginator.count_is_capped)
+
+    def test_elided_page_range(self):
+        page = CachedCountPaginator(Post.objects.all(), 2).get_page(8)
+        self.assertEqual(
+            page.elided_range, [1, '…', 6, 7, 8, 9, 10, '…', 15])
+
+    def test_numbered_feed(self):
+        with self.settings(FEED_PAGINATION='numbered'):
+            response = self.client.get(reverse('posts:index'), {'page': 6})
+        page = response.context['page_obj']
+        self.assertEqual(page.number, 6)
+        self.assertContains(response, '?page=5')
+
 
+@override_settings(PAGE_CACHE_TIMEOUT=0)
 class SuccessViewsTest(TestCase):
 
     @classmethod
@@ -320,6 +406,45 @@ class ViewsTestImages(TestCase):
         first_object = response.context['posts']
         self.check_post_data(first_object)
 
+    def test_page_thumbnails_are_fetched_at_once(self):
+        cache.clear()
+        posts = [self.post] + [
+            Post.objects.create(
+                text=f'Пост {number}', author=self.author,
+                image=self.post.image)
+            for number in range(3)
+        ]
+        generate(self.post.image.name)
+        prefetch(posts)
+        self.assertIn('cache/', posts[0].thumbnail.url)
+        cache.clear()
+        with self.assertNumQueries(1):
+            prefetch(posts)
+        with self.assertNumQueries(0):
+            prefetch(posts)
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, posts[0].thumbnail.url)
+
+    def test_card_image_is_responsive(self):
+        cache.clear()
+        response = self.authorized_client.get(reverse('posts:index'))
+        post = response.context['page_obj'][0]
+        widths = {thumbnail.width for thumbnail, _ in post.image_variants}
+        self.assertContains(response, 'loading="lazy"')
+        for width in widths:
+            self.assertContains(response, f' {width}w')
+        if 'WEBP' in {image_format for _, image_format in post.image_variants}:
+            self.assertContains(response, 'type="image/webp"')
+
+    def test_unknown_format_is_skipped(self):
+        cache.clear()
+        response = self.authorized_client.get(reverse('posts:index'))
+        post = response.context['page_obj'][0]
+        post.image_variants.append((post.thumbnail, 'JXL'))
+        formats = {image_format for _, image_format in post.image_variants}
+        # запасной формат уходит в <img>, незнакомый пропускается
+        self.assertEqual(len(card_image(post)['sources']), len(formats) - 2)
+
 
 class TestCommentsAdded(TestCase):
     @classmethod
@@ -358,6 +483,7 @@ class TestCommentsAdded(TestCase):
         self.assertEqual(first_object, self.post.comments)
 
 
+@override_settings(PAGE_CACHE_TIMEOUT=0)
 class CacheTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -395,6 +521,123 @@ class CacheTest(TestCase):
         posts_all2 = response2.context['page_obj']
         self.assertNotEquals(posts_all2, posts_all)
 
+    def test_fragment_cache_follows_writes(self):
+        """Новый пост виден на главной без сброса кэша."""
+        cache.clear()
+        self.guest_client.get(reverse('posts:index'))
+        Post.objects.create(text='Свежий пост', author=self.user_author)
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Свежий пост')
+
+    def test_post_card_cache(self):
+        """Карточка рендерится один раз и меняется после правки поста."""
+        cache.clear()
+        self.guest_client.get(reverse('posts:index'))
+        self.assertIsNotNone(cache.get(card_key(self.post)))
+        cards = PageCards([self.post])
+        with self.assertNumQueries(0):
+            self.assertIn('пост', cards.get(self.post))
+        self.post.text = 'Отредактированный пост'
+        self.post.save()
+        response = self.guest_client.get(
+            reverse('posts:profile', args=(self.user_author.username,)))
+        self.assertContains(response, 'Отредактированный пост')
+
+    def test_author_rename_refreshes_feeds(self):
+        """Новое имя автора видно в закэшированных лентах сразу."""
+        cache.clear()
+        url = reverse('posts:index')
+        self.assertContains(self.guest_client.get(url), 'Mask')
+        etag = self.guest_client.get(url)['ETag']
+        author = User.objects.get(pk=self.user_author.pk)
+        author.first_name = 'Илон'
+        author.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Илон')
+        author.username = 'Musk'
+        author.save()
+        response = self.guest_client.get(
+            reverse('posts:profile', args=('Musk',)))
+        self.assertContains(response, reverse(
+            'posts:profile', args=('Musk',)))
+        self.assertNotContains(self.guest_client.get(url), '/profile/Mask/')
+
+    def test_group_cards_are_truncated(self):
+        group = Group.objects.create(title='Группа', slug='cards')
+        Post.objects.create(
+            text=' '.join(['слово'] * 40), author=self.user_author,
+            group=group)
+        response = self.guest_client.get(
+            reverse('posts:group_posts', args=('cards',)))
+        self.assertContains(response, ' '.join(['слово'] * 30) + ' …')
+
+    def test_fragment_cache_is_page_aware(self):
+        """Вторая страница не отдаёт закэшированную первую."""
+        cache.clear()
+        for number in range(6):
+            Post.objects.create(
+                text=f'Пост номер {number}', author=self.user_author)
+        first = self.guest_client.get(reverse('posts:index'))
+        second = self.guest_client.get(
+            reverse('posts:index'),
+            {'cursor': first.context['page_obj'].next_cursor})
+        self.assertContains(first, 'Пост номер 5')
+        self.assertNotContains(second, 'Пост номер 5')
+        self.assertContains(second, 'Пост номер 0')
+
+
+class StaleWhileRevalidateTest(TestCase):
+    def setUp(self):
+        flush_metrics()
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value):
+        def compute():
+            self.calls += 1
+            return value
+        return compute
+
+    def fetch(self, value, version=1, timeout=60):
+        return stale_while_revalidate(
+            'swr-test', self.compute(value), timeout,
+            version=version, name='test')
+
+    def test_fresh_value_is_reused(self):
+        self.assertEqual(self.fetch('первое'), 'первое')
+        self.assertEqual(self.fetch('второе'), 'первое')
+        self.assertEqual(self.calls, 1)
+        metrics = swr_metrics('test')
+        self.assertEqual((metrics['recomputes'], metrics['hits']), (1, 1))
+
+    @override_settings(SWR_METRICS_FLUSH_INTERVAL=60)
+    def test_hits_are_counted_in_process(self):
+        """Попадание не пишет в общий кэш, счётчик копится в процессе."""
+        self.fetch('первое')
+        flush_metrics()
+        for _ in range(3):
+            self.fetch('второе')
+        self.assertIsNone(cache.get(METRIC_KEY.format('test', 'hits')))
+        self.assertEqual(swr_metrics('test')['hits'], 3)
+
+    def test_stale_value_is_served_while_locked(self):
+        self.fetch('первое')
+        cache.add(LOCK_KEY.format('swr-test'), 'другой воркер')
+        self.assertEqual(self.fetch('второе', version=2), 'первое')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(swr_metrics('test')['stale'], 1)
+
+    def test_single_worker_recomputes(self):
+        self.fetch('первое')
+        self.assertEqual(self.fetch('второе', version=2), 'второе')
+        self.assertEqual(self.fetch('третье', version=2), 'второе')
+        self.assertIsNone(cache.get(LOCK_KEY.format('swr-test')))
+
+    def test_expired_value_is_recomputed(self):
+        self.fetch('первое', timeout=-1)
+        self.assertEqual(self.fetch('второе'), 'второе')
+
 
 class FollowTest(TestCase):
     @classmethod
@@ -442,3 +685,441 @@ class FollowTest(TestCase):
         )
         counter_1 = Follow.objects.count()
         self.assertEqual(counter_0, counter_1 + 1)
+
+    def test_timeline_follows_subscriptions(self):
+        """Лента подписок пополняется при подписке и новом посте."""
+        reader = User.objects.create_user(username='Reader')
+        reader_client = Client()
+        reader_client.force_login(reader)
+        reader_client.get(
+            reverse('posts:profile_follow', args=(self.user.username,)))
+        new_post = Post.objects.create(text='Новый', author=self.user)
+        response = reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, self.post])
+        reader_client.get(
+            reverse('posts:profile_unfollow', args=(self.user.username,)))
+        response = reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_follow_feed_engines_agree(self):
+        """Все движки ленты подписок отдают одинаковые страницы."""
+        reader = User.objects.create_user(username='Reader')
+        other = User.objects.create_user(username='Other')
+        Follow.objects.create(user=reader, author=self.user)
+        Follow.objects.create(user=reader, author=other)
+        for number in range(12):
+            Post.objects.create(
+                text=f'Пост {number}',
+                author=(self.user, other)[number % 2])
+        reader_client = Client()
+        reader_client.force_login(reader)
+        url = reverse('posts:follow_index')
+        pages, cursors = {}, {}
+        for engine in ('join', 'timeline', 'merge'):
+            with self.settings(FOLLOW_FEED_ENGINE=engine):
+                first = reader_client.get(url).context['page_obj']
+                cursors[engine] = first.next_cursor
+                second = reader_client.get(
+                    url, {'cursor': first.next_cursor}).context['page_obj']
+                back = reader_client.get(
+                    url, {'cursor': second.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(list(back), list(first))
+                pages[engine] = list(first) + list(second)
+        self.assertEqual(len(pages['join']), 13)
+        self.assertEqual(pages['timeline'], pages['join'])
+        self.assertEqual(pages['merge'], pages['join'])
+        # курсор одинаков у всех движков: смена движка не ломает ссылки
+        self.assertEqual(len(set(cursors.values())), 1)
+
+    def test_merge_loads_cold_authors_in_one_query(self):
+        authors = [
+            User.objects.create_user(username=f'Author{number}')
+            for number in range(4)]
+        for number in range(10):
+            Post.objects.create(
+                text=f'Пост {number}', author=authors[number % 4])
+        cache.clear()
+        with self.settings(FOLLOW_MERGE_RECENT=2), \
+                self.assertNumQueries(1):
+            streams = recent_post_keys(
+                [author.pk for author in authors] + [self.user.pk])
+        posts = Post.objects.order_by('-pub_date', '-pk')
+        self.assertEqual(streams[0], [
+            (post.pub_date, post.pk)
+            for post in posts.filter(author=authors[0])[:2]])
+        self.assertEqual(streams[-1], [(self.post.pub_date, self.post.pk)])
+        with self.assertNumQueries(0):
+            recent_post_keys([author.pk for author in authors])
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=600)
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mask')
+        cls.group = Group.objects.create(
+            title='Тест групп',
+            slug='test-slug',
+            description='Тест описания',
+        )
+        cls.post = Post.objects.create(
+            text='пост', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_anonymous_page_is_cached(self):
+        """Повторный запрос анонима обходит view и базу."""
+        url = reverse('posts:group_posts', args=(self.group.slug,))
+        self.guest_client.get(url)
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url)
+        self.assertContains(response, 'пост')
+
+    def test_authorized_user_is_not_cached(self):
+        client = Client()
+        client.force_login(self.author)
+        client.get(reverse('posts:index'))
+        response = client.get(reverse('posts:index'))
+        self.assertIsNotNone(response.context)
+
+    def test_changes_purge_affected_pages(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+        )
+        for url in urls:
+            self.guest_client.get(url)
+        Post.objects.create(
+            text='Новая запись', author=self.author, group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'Новая запись')
+
+        detail = reverse('posts:post_detail', args=(self.post.pk,))
+        self.guest_client.get(detail)
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Комментарий')
+        self.assertContains(self.guest_client.get(detail), 'Комментарий')
+
+    def test_new_post_refreshes_other_detail_pages(self):
+        """Число постов автора на страницах его старых постов."""
+        detail = reverse('posts:post_detail', args=(self.post.pk,))
+        self.assertContains(
+            self.guest_client.get(detail), 'автора: <span> 1 </span>')
+        Post.objects.create(text='ещё пост', author=self.author)
+        self.assertContains(
+            self.guest_client.get(detail), 'автора: <span> 2 </span>')
+
+    def test_group_rename_refreshes_detail_pages(self):
+        detail = reverse('posts:post_detail', args=(self.post.pk,))
+        self.guest_client.get(detail)
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Новое название'
+        group.save()
+        self.assertContains(self.guest_client.get(detail), 'Новое название')
+
+    def test_old_group_slug_is_purged(self):
+        old = reverse('posts:group_posts', args=(self.group.slug,))
+        self.assertEqual(self.guest_client.get(old).status_code, 200)
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'new-slug'
+        group.save()
+        self.assertEqual(self.guest_client.get(old).status_code, 404)
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=600)
+class PurgeOnCommitTest(TransactionTestCase):
+    def test_page_cached_before_commit_is_purged(self):
+        """Страница, закэшированная до коммита, сбрасывается после него."""
+        cache.clear()
+        author = User.objects.create_user(username='Mask')
+        url = reverse('posts:index')
+        with transaction.atomic():
+            Post.objects.create(text='пост', author=author)
+            # так её положил бы аноним из другого воркера: поста он
+            # ещё не видит, а версия страницы уже новая
+            stale = page_key(url, '')
+            cache.set(stale, 'старая страница')
+            generation = generations(Post._meta.db_table)
+        self.assertNotEqual(page_key(url, ''), stale)
+        self.assertNotEqual(generations(Post._meta.db_table), generation)
+
+    def test_author_posts_cached_before_commit_are_dropped(self):
+        cache.clear()
+        author = User.objects.create_user(username='Mask')
+        with transaction.atomic():
+            post = Post.objects.create(text='пост', author=author)
+            # так их положила бы лента подписок другого воркера,
+            # ещё не видящего поста
+            cache.set(recent_key(author.pk), [])
+        self.assertEqual(
+            recent_post_keys([author.pk]), [[(post.pub_date, post.pk)]])
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mask')
+        cls.group = Group.objects.create(
+            title='Тест групп',
+            slug='test-slug',
+            description='Тест описания',
+        )
+        cls.post = Post.objects.create(
+            text='пост', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+        )
+
+    def test_unchanged_page_is_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertTrue(response.has_header('Last-Modified'))
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_changes_invalidate_validators(self):
+        etags = {url: self.guest_client.get(url)['ETag'] for url in self.urls}
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Комментарий')
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_validators_depend_on_user(self):
+        url = reverse('posts:index')
+        etag = self.guest_client.get(url)['ETag']
+        client = Client()
+        client.force_login(self.author)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_follow_index_is_not_modified(self):
+        client = Client()
+        follower = User.objects.create_user(username='Reader')
+        client.force_login(follower)
+        Follow.objects.create(user=follower, author=self.author)
+        url = reverse('posts:follow_index')
+        etag = client.get(url)['ETag']
+        self.assertEqual(
+            client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Post.objects.create(text='Новая запись', author=self.author)
+        self.assertEqual(
+            client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mask')
+        cls.rocket = Post.objects.create(
+            text='Ракета села на баржу', author=cls.author)
+        cls.rockets = Post.objects.create(
+            text='Ракета, ещё ракета и снова ракета', author=cls.author)
+        Post.objects.create(text='Про тоннели', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:search')
+
+    def test_schema_matches_search_module(self):
+        """Миграции создают ровно тот индекс, что описан в posts.search."""
+        def normalized(sql):
+            return ' '.join(sql.split())
+
+        self.assertEqual(search_module.missing_triggers(), [])
+        self.assertEqual(
+            sorted(map(normalized, search_module.schema().values())),
+            sorted(normalized(sql) for sql in search_module.CREATE_SQL
+                   if sql.startswith('CREATE')))
+
+    def test_results_are_ranked(self):
+        response = self.client.get(self.url, {'q': 'ракета'})
+        self.assertEqual(
+            list(response.context['page_obj']), [self.rockets, self.rocket])
+        self.assertEqual(response.context['page_obj'].paginator.count, 2)
+
+    def test_last_word_is_a_prefix_and_syntax_is_ignored(self):
+        for query in ('бар', 'ракета -бар*', '("баржу'):
+            with self.subTest(query=query):
+                response = self.client.get(self.url, {'q': query})
+                self.assertEqual(
+                    list(response.context['page_obj']), [self.rocket])
+        response = self.client.get(self.url, {'q': '*!'})
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.create(text='Марс', author=self.author)
+        Post.objects.filter(pk=post.pk).update(text='Луна')
+        self.assertEqual(
+            list(self.client.get(self.url, {'q': 'луна'})
+                 .context['page_obj']), [post])
+        post.delete()
+        self.assertEqual(
+            len(self.client.get(self.url, {'q': 'луна'})
+                .context['page_obj']), 0)
+
+    def test_pages_keep_query(self):
+        for number in range(6):
+            Post.objects.create(text=f'Ракета {number}', author=self.author)
+        response = self.client.get(self.url, {'q': 'ракета'})
+        self.assertContains(response, '?page=2&amp;q=%D1%80')
+
+    def test_admin_uses_index(self):
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'баржу'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.rocket])
+
+
+class AdminChangelistTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def add_posts(self, count):
+        for number in range(count):
+            author = User.objects.create_user(f'author{Post.objects.count()}')
+            group = Group.objects.create(
+                title=f'Группа {number}', slug=f'group-{author.pk}',
+                description='Описание')
+            post = Post.objects.create(
+                text='Пост', author=author, group=group)
+            Comment.objects.create(post=post, author=author, text='Ответ')
+
+    def count_queries(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_rows(self):
+        for name in ('post', 'comment'):
+            with self.subTest(name=name):
+                url = reverse(f'admin:posts_{name}_changelist')
+                self.add_posts(2)
+                self.count_queries(url)
+                few = self.count_queries(url)
+                self.add_posts(5)
+                self.count_queries(url)
+                self.assertEqual(self.count_queries(url), few)
+
+    def test_follow_changelist_does_not_list_every_user(self):
+        User.objects.create_user('lurker')
+        response = self.client.get(reverse('admin:posts_follow_changelist'))
+        self.assertNotContains(response, 'lurker')
+
+    def test_comment_search_by_author(self):
+        self.add_posts(2)
+        response = self.client.get(
+            reverse('admin:posts_comment_changelist'), {'q': 'author1'})
+        self.assertEqual(
+            [comment.author.username
+             for comment in response.context['cl'].result_list],
+            ['author1'])
+
+    @override_settings(ADMIN_COUNT_LIMIT=2)
+    def test_large_table_count_is_estimated(self):
+        self.add_posts(3)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        paginator = EstimatedCountPaginator(Post.objects.all(), 10)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.count, 3)
+        self.assertFalse(
+            [query for query in queries if 'COUNT(' in query['sql']])
+        self.assertTrue(paginator.count_is_capped)
+
+
+@override_settings(COMMENTS_PER_CHUNK=10)
+class CommentChunksTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create_user(username='Mask')
+        cls.post = Post.objects.create(text='Пост', author=author)
+        for number in range(25):
+            Comment.objects.create(
+                post=cls.post, text=f'Ответ {number}',
+                author=User.objects.create_user(username=f'reader{number}'))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_comments_come_in_chunks(self):
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        seen = list(response.context['comments'])
+        cursor = response.context['next_cursor']
+        while cursor:
+            response = self.client.get(
+                reverse('posts:post_comments', args=(self.post.pk,)),
+                {'cursor': cursor})
+            self.assertLessEqual(len(response.context['comments']), 10)
+            seen.extend(response.context['comments'])
+            cursor = response.context['next_cursor']
+        self.assertEqual(
+            [comment.text for comment in seen],
+            [f'Ответ {number}' for number in range(25)])
+
+    def test_missing_post_is_not_found(self):
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post.pk + 1,)))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_authors_are_joined(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('posts:post_detail', args=(self.post.pk,)))
+        self.assertContains(response, 'reader9')
+        self.assertLess(len(queries), 10)
+
+
+@override_settings(THUMBNAIL_PREGENERATE='sync')
+class ThumbnailPregenerationTest(TransactionTestCase):
+    def test_thumbnails_are_ready_after_upload(self):
+        # одинаковые картинки других тестов лежат под тем же хешем,
+        # а их записи sorl в кэше пережили откат базы
+        cache.clear()
+        author = User.objects.create_user('Mask')
+        image = SimpleUploadedFile(
+            name='small.gif',
+            content=(
+                b'\x47\x49\x46\x38\x39\x61\x02\x00'
+                b'\x01\x00\x80\x00\x00\x00\x00\x00'
+                b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+                b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+                b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+                b'\x0A\x00\x3B'
+            ),
+            content_type='image/gif',
+        )
+        post = Post.objects.create(text='пост', author=author, image=image)
+        self.assertIsNotNone(default.kvstore.get(ImageFile(post.image)))
@@ -0,0 +1,188 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import transaction
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+
+# sorl импортируется внутри функций: воркер пула загружает этот модуль
+# до django.setup(), а sorl при импорте требует готовые приложения
+
+
+def _setup_worker():
+    # spawn, а не fork: воркер не наследует соединения с базой и кэшем
+    django.setup()
+
+
+def worker_pool(max_workers=None):
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_setup_worker,
+    )
+
+
+def source(name):
+    """ImageFile картинки поста с хранилищем поля Post.image.
+
+    Хранилище входит в ключ sorl: по голому имени sorl взял бы
+    default_storage, и ключи не совпали бы с ключами post.image.
+    """
+    from sorl.thumbnail.images import ImageFile
+
+    from .models import Post
+
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def generate(name):
+    """Создаёт все варианты миниатюр (variants()) для файла name.
+
+    Уже готовые sorl находит в своём хранилище ключей и не
+    пересчитывает, поэтому повторный вызов дешёвый.
+    """
+    from sorl.thumbnail import get_thumbnail
+
+    for geometry, options in variants():
+        get_thumbnail(source(name), geometry, **options)
+    return name
+
+
+def _thumbnail_file(name, geometry, options):
+    """ImageFile миниатюры без обращения к хранилищу ключей.
+
+    Повторяет нормализацию опций из ThumbnailBackend.get_thumbnail:
+    имя файла миниатюры зависит от полного набора опций.
+    """
+    from sorl.thumbnail import default
+    from sorl.thumbnail.conf import defaults, settings as sorl_settings
+    from sorl.thumbnail.images import ImageFile
+
+    backend, image, options = default.backend, source(name), dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(image))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(defaults, attr):
+            options.setdefault(key, value)
+    return ImageFile(
+        backend._get_thumbnail_filename(image, geometry, options),
+        default.storage,
+    )
+
+
+def _lookup(keys):
+    """Сырые значения хранилища sorl по ключам: кэш, затем одна выборка."""
+    from sorl.thumbnail import default
+    from sorl.thumbnail.conf import settings as sorl_settings
+    from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+    from sorl.thumbnail.models import KVStore
+
+    kvstore = default.kvstore
+    if not hasattr(kvstore, 'cache'):
+        return {key: kvstore._get_raw(key) for key in keys}
+    found = {
+        key: value for key, value in kvstore.cache.get_many(keys).items()
+        if value != EMPTY_VALUE
+    }
+    missing = [key for key in keys if key not in found]
+    if missing:
+        stored = dict(KVStore.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        if stored:
+            kvstore.cache.set_many(
+                stored, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            found.update(stored)
+    return found
+
+
+def variants():
+    """Геометрии из THUMBNAIL_GEOMETRIES, которые умеет сохранять Pillow.
+
+    Сборка Pillow без libwebp не пишет WEBP — такие варианты молча
+    пропускаются, карточка остаётся на JPEG.
+    """
+    Image.init()
+    return [
+        (geometry, options)
+        for geometry, options in settings.THUMBNAIL_GEOMETRIES
+        if options.get('format', 'JPEG') in Image.SAVE
+    ]
+
+
+def prefetch(posts):
+    """Вешает на посты варианты картинки карточки.
+
+    post.image_variants — список (миниатюра, формат) по variants(),
+    post.thumbnail — первый из них, запасной src. Вместо поиска
+    в хранилище sorl на каждую миниатюру все варианты страницы
+    ищутся одним get_many (и одним запросом к базе для промахов
+    кэша); чего нет в хранилище, создаётся на месте.
+    """
+    from sorl.thumbnail import get_thumbnail
+    from sorl.thumbnail.images import deserialize_image_file
+    from sorl.thumbnail.kvstores.base import add_prefix
+
+    from core.query_budget import cache_fill
+
+    wanted = []
+    for post in posts:
+        post.thumbnail, post.image_variants = None, []
+        if post.image:
+            for geometry, options in variants():
+                thumbnail = _thumbnail_file(
+                    post.image.name, geometry, options)
+                wanted.append(
+                    (post, add_prefix(thumbnail.key), geometry, options))
+    found = _lookup(list({key for _, key, _, _ in wanted}))
+    resolved = {}
+    for post, key, geometry, options in wanted:
+        if key not in resolved and found.get(key):
+            resolved[key] = deserialize_image_file(found[key])
+        elif key not in resolved:
+            # миниатюра не была создана заранее: разовая работа. Её
+            # запросы видны в логе бюджета, но не роняют страницу
+            with cache_fill():
+                resolved[key] = get_thumbnail(
+                    post.image, geometry, **options)
+        post.image_variants.append(
+            (resolved[key], options.get('format', 'JPEG')))
+        post.thumbnail = post.image_variants[0][0]
+    return posts
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error('Миниатюры не созданы', exc_info=future.exception())
+
+
+def _submit(name):
+    global _pool
+    if _pool is None:
+        _pool = worker_pool(settings.THUMBNAIL_WORKERS)
+    _pool.submit(generate, name).add_done_callback(_log_failure)
+
+
+def pregenerate(name):
+    """Заказывает миниатюры для только что сохранённой картинки.
+
+    Работа уходит в пул процессов после коммита транзакции, чтобы
+    воркер не прочитал файл, запись о котором ещё откатится.
+    При THUMBNAIL_PREGENERATE = 'sync' считается на месте,
+    при пустом значении — выключено.
+    """
+    mode = settings.THUMBNAIL_PREGENERATE
+    if not name or not mode:
+        return
+    if mode == 'sync':
+        transaction.on_commit(lambda: generate(name))
+    else:
+        transaction.on_commit(lambda: _submit(name))
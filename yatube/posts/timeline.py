@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.db import transaction
+
+from .caching import bump_generation
+from .models import Follow, Post, Timeline
+
+BATCH_SIZE = 500
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам всех подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    entries = (
+        Timeline(user_id=user_id, post=post, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+    _bulk_create(entries)
+
+
+def fan_out_many(author_id, posts):
+    """fan_out для пачки постов одного автора: подписчики читаются раз.
+
+    posts — пары (id, pub_date).
+    """
+    followers = list(Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True))
+    _bulk_create(
+        Timeline(user_id=user_id, post_id=pk, pub_date=pub_date)
+        for pk, pub_date in posts for user_id in followers
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика последние посты нового автора."""
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date').values_list('pk', 'pub_date')
+    posts = posts[:settings.FOLLOW_TIMELINE_BACKFILL]
+    _bulk_create(
+        Timeline(user_id=user_id, post_id=pk, pub_date=pub_date)
+        for pk, pub_date in posts
+    )
+
+
+def prune(user_id, author_id):
+    Timeline.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+    bump_generation(Timeline._meta.db_table)
+
+
+def rebuild():
+    """Пересобирает ленты с нуля, например после смены движка ленты.
+
+    В одной транзакции: до конца пересборки читатели видят старые
+    ленты, а ошибка на полпути не оставляет их обрезанными.
+    """
+    with transaction.atomic():
+        Timeline.objects.all().delete()
+        for user_id, author_id in Follow.objects.values_list(
+                'user_id', 'author_id').iterator():
+            backfill(user_id, author_id)
+
+
+def _bulk_create(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            Timeline.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        Timeline.objects.bulk_create(batch, ignore_conflicts=True)
+    bump_generation(Timeline._meta.db_table)
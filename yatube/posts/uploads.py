@@ -0,0 +1,103 @@
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image, ImageOps
+
+# форматы, которые пересохраняем; анимированные и прочие — как есть
+NORMALIZED_FORMATS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 85, 'method': 4},
+}
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку сразу во временный файл, а не в память.
+
+    Сверх IMAGE_UPLOAD_MAX_BYTES байты дочитываются из запроса, но
+    не сохраняются; размер файла остаётся настоящим, и форма
+    отклонит его, не открывая.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.IMAGE_UPLOAD_MAX_BYTES:
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+
+def _megabytes(size):
+    return f'{size / 1024 / 1024:.0f} МБ'
+
+
+def is_oversized(upload):
+    return (
+        upload is not None
+        and upload.size > settings.IMAGE_UPLOAD_MAX_BYTES
+    )
+
+
+def check_size(upload):
+    if is_oversized(upload):
+        raise ValidationError(
+            'Файл больше %(limit)s.',
+            code='file_too_large',
+            params={'limit': _megabytes(settings.IMAGE_UPLOAD_MAX_BYTES)},
+        )
+
+
+def check_pixels(image):
+    """Image.open читает только заголовок, поэтому «бомба» из маленького
+    файла с огромными размерами отсекается до выделения памяти."""
+    width, height = image.size
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка больше %(limit)s мегапикселей.',
+            code='too_many_pixels',
+            params={'limit': settings.IMAGE_UPLOAD_MAX_PIXELS // 10 ** 6},
+        )
+
+
+def normalize(upload):
+    """Уменьшает картинку до IMAGE_MAX_SIDE и убирает метаданные.
+
+    Для JPEG draft() декодирует сразу в 1/2–1/8 разрешения, поэтому
+    фото на 50 Мп не разворачивается в память целиком. Ориентация
+    из EXIF применяется к пикселям до того, как EXIF выбрасывается;
+    цветовой профиль и прозрачность сохраняются. Результат — новый
+    временный файл.
+    """
+    check_size(upload)
+    upload.seek(0)
+    with Image.open(upload) as image:
+        check_pixels(image)
+        image_format = image.format
+        if (image_format not in NORMALIZED_FORMATS
+                or getattr(image, 'is_animated', False)):
+            upload.seek(0)
+            return upload
+        side = settings.IMAGE_MAX_SIDE
+        image.draft(None, (side, side))
+        icc_profile = image.info.get('icc_profile')
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((side, side), reducing_gap=2.0)
+        # прозрачность палитры и прочее из info нужны при сохранении
+        image.info.pop('exif', None)
+        options = dict(NORMALIZED_FORMATS[image_format])
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        # безымянный временный файл: хранилище скопирует его потоком,
+        # а удалит система при закрытии
+        normalized = tempfile.TemporaryFile()
+        image.save(normalized, format=image_format, **options)
+    size = normalized.tell()
+    normalized.seek(0)
+    return UploadedFile(
+        normalized, upload.name, upload.content_type, size)
@@ -1,43 +1,59 @@
-from django.core.paginator import Paginator
 from .forms import PostForm, CommentForm
-from .models import User, Post, Group, Follow
-from django.shortcuts import get_object_or_404, render, redirect
+from .counters import user_stats
+from .feeds import follow_page
+from .caching import fragment_context
+from .cards import attach_cards
+from .comments import comment_chunk
+from . import conditional, pages
+from .models import User, Post, Group, Follow, Comment, Timeline
+from .paginator import CachedCountPaginator, paginate
+from .search import search as search_posts
+from .thumbnails import prefetch
+from core.page_cache import depends_on
 from django.conf import settings
+from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import Http404
+from django.utils.http import urlencode
 
 
+@conditional.conditional_page(
+    conditional.all_posts, Post, Group, Comment, User)
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, settings.PAGINATOR_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(
+        request, Post.objects.select_related('author', 'group'))
+    attach_cards(page_obj)
     context = {
         'page_obj': page_obj,
+        **fragment_context(Post, Group, Comment, User),
     }
     return render(request, "posts/index.html", context)
 
 
+@conditional.conditional_page(
+    conditional.group_posts, Post, Group, Comment, User)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, settings.PAGINATOR_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, group.posts.select_related('author'))
+    attach_cards(page_obj, truncate=30)
     context = {
         'group': group,
-        'posts': posts,
         'page_obj': page_obj,
+        **fragment_context(Post, Group, Comment, User),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional.conditional_page(
+    conditional.author_posts, Post, Group, Comment, Follow, User)
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
+    user = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
     posts = user.posts.all()
-    paginator = Paginator(posts, settings.PAGINATOR_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    post_amount = posts.count()
+    page_obj = paginate(request, posts.select_related('author', 'group'))
+    attach_cards(page_obj)
+    stats = user_stats(user)
     if request.user.is_authenticated:
         following = Follow.objects.filter(
             user=request.user, author=user).exists()
@@ -47,26 +63,65 @@ def profile(request, username):
         'posts': posts,
         'page_obj': page_obj,
         'author': user,
-        'post_amount': post_amount,
+        'stats': stats,
+        'post_amount': stats.post_count,
         'following': following,
+        **fragment_context(Post, Group, Comment, User),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@conditional.conditional_page(
+    conditional.post_comments, Post, Group, Comment, User, field='created')
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    posts_count = post.author.posts.all().count()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id)
+    depends_on(request, *pages.post_tags(post))
+    posts_count = user_stats(post.author).post_count
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    comments, next_cursor = comment_chunk(post.pk)
+    prefetch([post])
     context = {
         'posts': post,
         'posts_count': posts_count,
         'form': form,
         'comments': comments,
+        'next_cursor': next_cursor,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@conditional.conditional_page(
+    conditional.post_comments, Comment, User, field='created')
+def post_comments(request, post_id):
+    """Следующая порция комментариев — фрагмент для post_detail."""
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404('Пост не найден')
+    comments, next_cursor = comment_chunk(
+        post_id, request.GET.get('cursor'))
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+        'next_cursor': next_cursor,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = CachedCountPaginator(
+        search_posts(query), settings.PAGINATOR_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    attach_cards(page_obj)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}),
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@transaction.atomic
 def post_create(request):
     template = 'posts/create_post.html'
     if request.method == 'POST':
@@ -83,6 +138,7 @@ def post_create(request):
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     if post.author != request.user:
@@ -105,6 +161,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -117,20 +174,20 @@ def add_comment(request, post_id):
 
 
 @login_required
+@conditional.conditional_page(
+    conditional.followed_posts, Post, Group, Comment, Follow, Timeline, User)
 def follow_index(request):
-    user = request.user
-    post_page = Post.objects.filter(author__following__user=user)
-    paginator = Paginator(post_page, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = follow_page(request, per_page=10)
+    attach_cards(page_obj)
     context = {
-        'post_page': post_page,
         'page_obj': page_obj,
+        **fragment_context(Post, Group, Comment, Follow, User),
     }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     if username != request.user.username:
         author_follow = get_object_or_404(User, username=username)
@@ -139,6 +196,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     followed_author = get_object_or_404(User, username=username)
     follower = Follow.objects.filter(user=request.user, author=followed_author)
@@ -53,10 +53,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.query_budget.QueryBudgetMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.page_cache.AnonymousPageCacheMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -144,13 +147,129 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 PAGINATOR_PER_PAGE = 5
+# комментариев в одной порции на странице поста
+COMMENTS_PER_CHUNK = 20
+# записей на странице JSON API по умолчанию и не больше чем
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 200
+# 'cursor' — ленты листаются курсором без COUNT(*),
+# 'numbered' — номерами страниц с кэшированным числом записей
+FEED_PAGINATION = 'cursor'
+# дальше этой границы записи в нумерованной пагинации не считаются
+PAGINATOR_COUNT_LIMIT = 10000
+PAGINATOR_COUNT_TIMEOUT = 60 * 60
+# граница точного подсчёта в списках админки; больше — оценка из
+# статистики базы (см. posts.paginator.EstimatedCountPaginator)
+ADMIN_COUNT_LIMIT = 100000
+# сколько старых постов автора попадает в ленту при подписке
+FOLLOW_TIMELINE_BACKFILL = 500
+# движок ленты подписок: 'timeline' (таблица Timeline, заполняется при
+# записи), 'merge' (слияние кэшированных постов авторов при чтении)
+# или 'join' (прямой запрос Post JOIN Follow)
+FOLLOW_FEED_ENGINE = 'timeline'
+# сколько последних постов автора держать в кэше для движка 'merge'
+FOLLOW_MERGE_RECENT = 200
+FOLLOW_MERGE_TIMEOUT = 60 * 60
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# фрагменты лент сбрасываются сменой поколения, а не по таймауту
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 6
+# устаревший фрагмент живёт ещё сутки и отдаётся, пока один запрос
+# его пересобирает; блокировка пересборки снимается не позже таймаута
+SWR_STALE_TIMEOUT = 60 * 60 * 24
+SWR_LOCK_TIMEOUT = 30
+# множитель раннего истечения: больше — пересборка начинается раньше
+SWR_BETA = 1.0
+# как часто процесс сбрасывает счётчики попаданий в общий кэш, в секундах
+SWR_METRICS_FLUSH_INTERVAL = 10
+# карточки постов адресуются по содержимому, устаревшие просто вытесняются
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+# загрузки пишутся сразу на диск; картинки больше лимитов отклоняются
+# до декодирования, остальные уменьшаются до IMAGE_MAX_SIDE по большей
+# стороне и пересохраняются без EXIF
+FILE_UPLOAD_HANDLERS = ['posts.uploads.BoundedUploadHandler']
+IMAGE_UPLOAD_MAX_BYTES = 25 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 64 * 10 ** 6
+IMAGE_MAX_SIDE = 1600
+# варианты картинки карточки: ширины для srcset в JPEG и WebP, первый —
+# запасной src. Создаются при сохранении картинки в пуле из
+# THUMBNAIL_WORKERS процессов (None — по числу ядер). 'sync' — на месте,
+# '' — выключено. Форматы, которых не умеет Pillow, пропускаются
+THUMBNAIL_GEOMETRIES = [
+    ('380x220', {'crop': 'center', 'upscale': True}),
+    ('760x440', {'crop': 'center'}),
+    ('380x220', {'crop': 'center', 'upscale': True, 'format': 'WEBP'}),
+    ('760x440', {'crop': 'center', 'format': 'WEBP'}),
+]
+CARD_IMAGE_SIZES = '(max-width: 576px) 100vw, 380px'
+THUMBNAIL_PREGENERATE = 'pool'
+THUMBNAIL_WORKERS = 2
+# кэш целых страниц для анонимов, 0 — выключен. Страницы сбрасываются
+# сигналами при изменениях. Ответ из кэша не несёт response.context:
+# тесты, которые его читают, выключают кэш через override_settings
+PAGE_CACHE_TIMEOUT = 60 * 10
+PAGE_CACHE_VIEWS = (
+    'posts:index',
+    'posts:group_posts',
+    'posts:profile',
+    'posts:post_detail',
+)
+# общий для всех воркеров кэш в файле рядом с базой: поколения,
+# блокировки пересборки и сбросы страниц видны каждому процессу.
+# Перед ним — L1 в памяти процесса для горячих ключей; сбросы
+# расходятся по воркерам через файл-журнал из LOCATION
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TwoLevelCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.journal'),
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_PREFIXES': [
+                'posts:generation:',
+                'posts:changed:',
+                'posts:fragment:',
+                'posts:card:',
+                'posts:count:',
+                'page:version:',
+            ],
+            'LOCAL_MAX_ENTRIES': 2000,
+            'LOCAL_TIMEOUT': 60,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+# счётчик запросов к базе на каждый запрос (core.query_budget): 'off',
+# 'log' — превышение бюджета и N+1 пишутся в лог со строкой шаблона,
+# 'raise' — ещё и исключение. Тестовый раннер включает 'raise', так что
+# страница, вышедшая за бюджет, роняет тесты
+QUERY_BUDGET_MODE = 'log' if DEBUG else 'off'
+TEST_RUNNER = 'core.test_runner.QueryBudgetRunner'
+# столько одинаковых по форме запросов за один запрос — это N+1
+QUERY_BUDGET_REPEAT = 5
+# бюджеты запросов GET по имени view, с запасом на холодный кэш и сессию
+QUERY_BUDGETS = {
+    'posts:index': 6,
+    'posts:group_posts': 8,
+    'posts:profile': 9,
+    'posts:post_detail': 7,
+    'posts:post_comments': 6,
+    'posts:search': 8,
+    'posts:post_create': 6,
+    'posts:post_edit': 7,
+    'posts:follow_index': 7,
+    'api_v1:posts': 4,
+    'api_v1:group_posts': 5,
+    'api_v1:author_posts': 5,
+    'api_v1:post_detail': 3,
+    'api_v1:post_comments': 5,
 }
 
 INTERNAL_IPS = [